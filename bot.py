@@ -3,12 +3,22 @@
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+from telegram.error import RetryAfter, TelegramError
 from dotenv import load_dotenv
-from config.settings import TELEGRAM_BOT_TOKEN, LOG_LEVEL
-from models import init_db, SessionLocal, Employee, Payroll, Cuti, Absensi
-from datetime import datetime, timedelta
+from config.settings import TELEGRAM_BOT_TOKEN, LOG_LEVEL, DASHBOARD_CACHE_SIZE, DASHBOARD_CACHE_TTL, AI_STREAMING, STREAM_EDIT_INTERVAL, WEBHOOK_URL, CONCURRENT_UPDATES
+from models import init_db, async_engine, AsyncSessionLocal, pool_stats, Employee, Payroll, Cuti, Absensi, AttendanceStats
+from sqlalchemy import select, event
+from datetime import datetime
 from utils.advanced_rag import advanced_rag
-import sys, random
+from utils.cache import TTLCache
+from utils.answer_cache import answer_cache
+from utils.prompt_builder import prompt_builder
+from utils.attendance_stats import get_attendance_stats, get_all_gamification_stats, summarize_30, EMPTY
+from utils.clock_in import clock_in_batcher, clock_out
+from utils.update_processor import PerChatUpdateProcessor
+from utils.employee_cache import employee_cache
+from utils.query_metrics import query_metrics, serve_metrics, track
+import sys, random, heapq, asyncio, time
 sys.path.insert(0, '.')
 
 load_dotenv()
@@ -50,52 +60,43 @@ def get_rating_stars(rating):
     stars = ratings.get(rating, 1)
     return "*" * stars + "-" * (5 - stars)
 
+LEVELS = [
+    (1000, "DIAMOND", "MAX", 0),
+    (900, "PLATINUM", "DIAMOND", 1000),
+    (750, "GOLD", "PLATINUM", 900),
+    (500, "SILVER", "GOLD", 750),
+    (0, "BRONZE", "SILVER", 500)
+]
+
 class EnterpriseFeatures:
     @staticmethod
-    def calculate_gamification(employee_id, db):
-        last_30 = datetime.now() - timedelta(days=30)
-        presensis = db.query(Absensi).filter(
-            Absensi.employee_id == employee_id,
-            Absensi.tanggal >= last_30
-        ).all()
-        
-        total = len(presensis)
-        hadir = len([p for p in presensis if p.status == 'hadir'])
-        on_time = len([p for p in presensis if p.waktu_masuk and p.waktu_masuk.hour <= 8])
-        
-        attendance_score = (hadir / 30 * 100) if total > 0 else 0
-        punctuality_score = (on_time / hadir * 100) if hadir > 0 else 0
-        
-        base_points = int(attendance_score * 5 + punctuality_score * 3)
-        
-        current_streak = 0
-        max_streak = 0
-        streak_bonus = 0
-        
-        sorted_presensis = sorted(presensis, key=lambda x: x.tanggal)
-        for p in sorted_presensis:
-            if p.status == 'hadir':
-                current_streak += 1
-                max_streak = max(max_streak, current_streak)
-                if current_streak >= 7:
-                    streak_bonus += 10
-            else:
-                current_streak = 0
-        
-        total_points = base_points + streak_bonus
-        
-        levels = [
-            (1000, "DIAMOND", "MAX", 0),
-            (900, "PLATINUM", "DIAMOND", 1000),
-            (750, "GOLD", "PLATINUM", 900),
-            (500, "SILVER", "GOLD", 750),
-            (0, "BRONZE", "SILVER", 500)
-        ]
+    async def calculate_gamification(employee_id, db):
+        stats = await db.run_sync(get_attendance_stats, employee_id)
+        return EnterpriseFeatures.score_gamification(stats)
+    
+    @staticmethod
+    def gamification_points(stats):
+        """(points, attendance_score, punctuality_score) from the 30-day counters."""
+        hadir = stats['hadir_30']
+        attendance_score = (hadir / 30 * 100) if stats['total_30'] > 0 else 0
+        punctuality_score = (stats['on_time_30'] / hadir * 100) if hadir > 0 else 0
+        points = int(attendance_score * 5 + punctuality_score * 3) + stats['streak_bonus_30']
+        return points, attendance_score, punctuality_score
+    
+    @staticmethod
+    def gamification_level(points):
+        """(level, next_level, points_needed)."""
+        for threshold, level, next_level, next_threshold in LEVELS:
+            if points >= threshold:
+                return level, next_level, next_threshold - points if next_threshold > 0 else 0
+    
+    @staticmethod
+    def score_gamification(stats):
+        current_streak = stats['current_streak']
+        max_streak = stats['max_streak_30']
         
-        for threshold, level, next_level, next_threshold in levels:
-            if total_points >= threshold:
-                needed = next_threshold - total_points if next_threshold > 0 else 0
-                break
+        total_points, attendance_score, punctuality_score = EnterpriseFeatures.gamification_points(stats)
+        level, next_level, needed = EnterpriseFeatures.gamification_level(total_points)
         
         achievements = []
         if attendance_score >= 98:
@@ -122,23 +123,45 @@ class EnterpriseFeatures:
         }
     
     @staticmethod
-    def generate_performance_score(employee_id, db):
-        last_90 = datetime.now() - timedelta(days=90)
-        presensis = db.query(Absensi).filter(
-            Absensi.employee_id == employee_id,
-            Absensi.tanggal >= last_90
-        ).all()
+    async def calculate_leaderboard(db, limit=10):
+        """True top-N from the materialised attendance_stats rows.
         
-        if not presensis:
+        Only points are computed per employee; names are loaded for the top N.
+        Ties keep employee id order. `python -m utils.attendance_stats --benchmark`
+        times this on 5,000 employees x 90 days.
+        """
+        all_stats = await db.run_sync(get_all_gamification_stats)
+        employee_ids = (await db.scalars(select(Employee.id).order_by(Employee.id))).all()
+        
+        points = {
+            employee_id: EnterpriseFeatures.gamification_points(stats)[0]
+            for employee_id, stats in all_stats.items()
+        }
+        empty_points = EnterpriseFeatures.gamification_points(EMPTY_STATS)[0]
+        top = heapq.nlargest(limit, employee_ids, key=lambda employee_id: points.get(employee_id, empty_points))
+        names = dict((await db.execute(select(Employee.id, Employee.nama).where(Employee.id.in_(top)))).tuples().all())
+        
+        return [
+            {'employee_id': employee_id, 'name': names[employee_id],
+             'points': points.get(employee_id, empty_points),
+             'level': EnterpriseFeatures.gamification_level(points.get(employee_id, empty_points))[0]}
+            for employee_id in top
+        ]
+    
+    @staticmethod
+    async def generate_performance_score(employee_id, db):
+        stats = await db.run_sync(get_attendance_stats, employee_id)
+        
+        if not stats['total_90']:
             return {"total": 0, "rating": "NO DATA", "attendance": 0, "punctuality": 0, "avg_hours": 0}
         
-        hadir = len([p for p in presensis if p.status == 'hadir'])
+        hadir = stats['hadir_90']
         attendance_rate = hadir / 90 * 100
         
-        on_time = len([p for p in presensis if p.waktu_masuk and p.waktu_masuk.hour <= 8])
+        on_time = stats['on_time_90']
         punctuality_rate = (on_time / hadir * 100) if hadir > 0 else 0
         
-        total_hours = sum(p.jam_kerja for p in presensis if p.jam_kerja)
+        total_hours = stats['total_hours_90']
         avg_hours = total_hours / hadir if hadir > 0 else 0
         
         attendance_score = attendance_rate * 0.4
@@ -167,80 +190,133 @@ class EnterpriseFeatures:
             "avg_hours": avg_hours
         }
 
+EMPTY_STATS = summarize_30(EMPTY * 30)
+
 enterprise = EnterpriseFeatures()
 
-async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    db = SessionLocal()
-    try:
-        employee = db.query(Employee).filter(Employee.telegram_user_id == user.id).first()
-        if not employee:
-            text = (
-                "<b>BPKH HR 5.0 PREMIUM</b>\n\n"
-                "<i>Revolutionary HR System</i>\n"
-                "-------------------------------\n\n"
-                "<b>All Features Active:</b>\n"
-                "  - Smart Attendance\n"
-                "  - Payroll Management\n"
-                "  - Performance Analytics\n"
-                "  - Gamification System\n"
-                "  - AI Assistant\n"
-                "  - And MORE!\n\n"
-                "Type /register to start\n\n"
-                f"<i>by {DEVELOPER}</i>"
-            )
-            await update.message.reply_text(text, parse_mode='HTML')
-            return
-        await show_main_menu(update, context, employee)
-    finally:
-        db.close()
+# Rendered main menu per employee: (day, version, text, markup). Keyed by employee id
+# and dropped on attendance/payroll writes in this process; the stored day handles
+# date rollover. Writes from other replicas (webhook mode) or through Core statements
+# fire no event here, so every hit is also checked against dashboard_version().
+dashboard_cache = TTLCache('dashboard', maxsize=DASHBOARD_CACHE_SIZE, ttl=DASHBOARD_CACHE_TTL, log_every=500)
 
-async def register_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@event.listens_for(Absensi, 'after_insert')
+@event.listens_for(Absensi, 'after_update')
+@event.listens_for(Absensi, 'after_delete')
+@event.listens_for(Payroll, 'after_insert')
+@event.listens_for(Payroll, 'after_update')
+@event.listens_for(Payroll, 'after_delete')
+def invalidate_dashboard(mapper, connection, target):
+    dashboard_cache.invalidate(target.employee_id)
+
+async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db = SessionLocal()
-    try:
-        employee = db.query(Employee).filter(Employee.telegram_user_id == user.id).first()
-        if employee:
-            await update.message.reply_text(f"Already registered: <b>{employee.nama}</b>", parse_mode='HTML')
-            return
-        
-        unclaimed = db.query(Employee).filter(Employee.telegram_user_id >= 100000).first()
-        if not unclaimed:
-            await update.message.reply_text("No employee data available.")
-            return
-        
-        unclaimed.telegram_user_id = user.id
-        db.commit()
-        
+    employee = await employee_cache.get(user.id)
+    if not employee:
         text = (
-            "<b>REGISTRATION SUCCESS!</b>\n\n"
-            f"Name: {unclaimed.nama}\n"
-            f"Position: {unclaimed.jabatan}\n"
-            f"Dept: {unclaimed.departemen}\n\n"
-            "Your account is active!\n\n"
-            "/start to explore"
+            "<b>BPKH HR 5.0 PREMIUM</b>\n\n"
+            "<i>Revolutionary HR System</i>\n"
+            "-------------------------------\n\n"
+            "<b>All Features Active:</b>\n"
+            "  - Smart Attendance\n"
+            "  - Payroll Management\n"
+            "  - Performance Analytics\n"
+            "  - Gamification System\n"
+            "  - AI Assistant\n"
+            "  - And MORE!\n\n"
+            "Type /register to start\n\n"
+            f"<i>by {DEVELOPER}</i>"
         )
         await update.message.reply_text(text, parse_mode='HTML')
-    finally:
-        db.close()
+        return
+    await show_main_menu(update, context, employee)
+
+async def register_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    # The session is closed before replying so no pooled connection waits on Telegram
+    async with AsyncSessionLocal() as db:
+        employee = await db.scalar(select(Employee).filter(Employee.telegram_user_id == user.id))
+        unclaimed = None
+        if not employee:
+            unclaimed = await db.scalar(select(Employee).filter(Employee.telegram_user_id >= 100000))
+            if unclaimed:
+                unclaimed.telegram_user_id = user.id
+                await db.commit()
+                employee_cache.invalidate(user.id)
+    
+    if employee:
+        await update.message.reply_text(f"Already registered: <b>{employee.nama}</b>", parse_mode='HTML')
+        return
+    
+    if not unclaimed:
+        await update.message.reply_text("No employee data available.")
+        return
+    
+    text = (
+        "<b>REGISTRATION SUCCESS!</b>\n\n"
+        f"Name: {unclaimed.nama}\n"
+        f"Position: {unclaimed.jabatan}\n"
+        f"Dept: {unclaimed.departemen}\n\n"
+        "Your account is active!\n\n"
+        "/start to explore"
+    )
+    await update.message.reply_text(text, parse_mode='HTML')
+
+async def dashboard_version(employee_id: int) -> tuple:
+    """What the main menu is rendered from, as one primary-key-sized query.
+
+    Every clock-in/out folds into AttendanceStats (bumping updated_at) in the
+    same transaction, and the salary line is the current Payroll total.
+    """
+    stats_updated = select(AttendanceStats.updated_at).where(
+        AttendanceStats.employee_id == employee_id
+    ).scalar_subquery()
+    salary = select(Payroll.total_gaji).where(
+        Payroll.employee_id == employee_id,
+        Payroll.periode == datetime.now().strftime('%Y-%m')
+    ).limit(1).scalar_subquery()
+    async with AsyncSessionLocal() as db:
+        return tuple((await db.execute(select(stats_updated, salary))).one())
 
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, employee):
-    db = SessionLocal()
-    try:
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        presensi = db.query(Absensi).filter(
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    # Read before rendering: a write in between only makes the next check miss
+    version = await dashboard_version(employee.id)
+    cached = dashboard_cache.get(employee.id)
+    if cached and cached[0] == today and cached[1] == version:
+        text, reply_markup = cached[2], cached[3]
+    else:
+        text, reply_markup = await render_main_menu(employee, today)
+        dashboard_cache.set(employee.id, (today, version, text, reply_markup))
+    
+    if update.callback_query:
+        await update.callback_query.edit_message_text(
+            text=text,
+            reply_markup=reply_markup,
+            parse_mode='HTML'
+        )
+    else:
+        await update.message.reply_text(
+            text=text,
+            reply_markup=reply_markup,
+            parse_mode='HTML'
+        )
+
+async def render_main_menu(employee, today):
+    async with AsyncSessionLocal() as db:
+        presensi = await db.scalar(select(Absensi).filter(
             Absensi.employee_id == employee.id,
             Absensi.tanggal == today
-        ).first()
+        ))
         
         current = datetime.now().strftime('%Y-%m')
-        payroll = db.query(Payroll).filter(
+        payroll = await db.scalar(select(Payroll).filter(
             Payroll.employee_id == employee.id,
             Payroll.periode == current
-        ).first()
+        ))
         
-        game = enterprise.calculate_gamification(employee.id, db)
-        perf = enterprise.generate_performance_score(employee.id, db)
+        game = await enterprise.calculate_gamification(employee.id, db)
+        perf = await enterprise.generate_performance_score(employee.id, db)
         
         keyboard = [
             [
@@ -309,73 +385,55 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, emp
             f"<i>Select an option:</i>"
         )
         
-        if update.callback_query:
-            await update.callback_query.edit_message_text(
-                text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode='HTML'
-            )
-        else:
-            await update.message.reply_text(
-                text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode='HTML'
-            )
-    finally:
-        db.close()
+        return text, InlineKeyboardMarkup(keyboard)
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    db = SessionLocal()
-    try:
-        employee = db.query(Employee).filter(
-            Employee.telegram_user_id == update.effective_user.id
-        ).first()
-        
-        if not employee:
-            await query.edit_message_text("Not registered. Use /register")
-            return
-        
-        handlers = {
-            'main_menu': lambda: show_main_menu(update, context, employee),
-            'about': lambda: handle_about(query),
-            'gamification': lambda: handle_gamification(query, employee, db),
-            'leaderboard': lambda: handle_leaderboard(query, employee, db),
-            'clock_in': lambda: handle_clock_in(query, employee, db),
-            'clock_out': lambda: handle_clock_out(query, employee, db),
-            'ai_mode': lambda: handle_ai_mode(query, employee, context),
-            'analytics': lambda: handle_analytics(query, employee, db),
-            'profile': lambda: handle_profile(query, employee, db),
-            'alerts': lambda: handle_alerts(query, employee, db),
-            'payroll': lambda: handle_payroll_menu(query),
-            'attendance': lambda: handle_attendance_menu(query),
-            'leave': lambda: handle_leave_menu(query),
-            'performance': lambda: handle_performance_menu(query),
-            'overtime': lambda: handle_overtime(query),
-            'more_features': lambda: handle_more_features(query),
-            # More Features Sub-menus
-            'expense_tracker': lambda: handle_expense_tracker(query),
-            'team_collab': lambda: handle_team_collab(query),
-            'learning_hub': lambda: handle_learning_hub(query),
-            'wellness': lambda: handle_wellness(query),
-            'doc_vault': lambda: handle_doc_vault(query),
-            'career_path': lambda: handle_career_path(query),
-            'feedback_system': lambda: handle_feedback_system(query),
-            'goal_tracker': lambda: handle_goal_tracker(query)
-        }
-        
-        handler = handlers.get(query.data)
-        if handler:
-            await handler()
-        else:
-            text = f"<b>{query.data.upper()}</b>\n\nFully operational!"
-            keyboard = [[InlineKeyboardButton("Back", callback_data='main_menu')]]
-            await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+    # Handlers that need the database open their own session and close it before
+    # calling Telegram, so pooled connections are never held across an API round trip
+    employee = await employee_cache.get(update.effective_user.id)
+    
+    if not employee:
+        await query.edit_message_text("Not registered. Use /register")
+        return
+    
+    handlers = {
+        'main_menu': lambda: show_main_menu(update, context, employee),
+        'about': lambda: handle_about(query),
+        'gamification': lambda: handle_gamification(query, employee),
+        'leaderboard': lambda: handle_leaderboard(query, employee),
+        'clock_in': lambda: handle_clock_in(query, employee),
+        'clock_out': lambda: handle_clock_out(query, employee),
+        'ai_mode': lambda: handle_ai_mode(query, employee, context),
+        'analytics': lambda: handle_analytics(query, employee),
+        'profile': lambda: handle_profile(query, employee),
+        'alerts': lambda: handle_alerts(query, employee),
+        'payroll': lambda: handle_payroll_menu(query),
+        'attendance': lambda: handle_attendance_menu(query),
+        'leave': lambda: handle_leave_menu(query),
+        'performance': lambda: handle_performance_menu(query),
+        'overtime': lambda: handle_overtime(query),
+        'more_features': lambda: handle_more_features(query),
+        # More Features Sub-menus
+        'expense_tracker': lambda: handle_expense_tracker(query),
+        'team_collab': lambda: handle_team_collab(query),
+        'learning_hub': lambda: handle_learning_hub(query),
+        'wellness': lambda: handle_wellness(query),
+        'doc_vault': lambda: handle_doc_vault(query),
+        'career_path': lambda: handle_career_path(query),
+        'feedback_system': lambda: handle_feedback_system(query),
+        'goal_tracker': lambda: handle_goal_tracker(query)
+    }
     
-    finally:
-        db.close()
+    handler = handlers.get(query.data)
+    if handler:
+        await handler()
+    else:
+        text = f"<b>{query.data.upper()}</b>\n\nFully operational!"
+        keyboard = [[InlineKeyboardButton("Back", callback_data='main_menu')]]
+        await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
 
 # ==========================================
 # MAIN MENU HANDLERS
@@ -721,8 +779,9 @@ async def handle_goal_tracker(query):
 # GAMIFICATION HANDLERS
 # ==========================================
 
-async def handle_gamification(query, employee, db):
-    game = enterprise.calculate_gamification(employee.id, db)
+async def handle_gamification(query, employee):
+    async with AsyncSessionLocal() as db:
+        game = await enterprise.calculate_gamification(employee.id, db)
     level_badge = get_level_emoji(game['level'])
     
     progress_pct = (game['points'] / (game['points'] + game['points_needed']) * 100) if game['points_needed'] > 0 else 100
@@ -767,20 +826,11 @@ async def handle_gamification(query, employee, db):
     ]
     await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
 
-async def handle_leaderboard(query, employee, db):
-    employees = db.query(Employee).limit(10).all()
-    leaderboard = []
-    
-    for emp in employees:
-        game_data = enterprise.calculate_gamification(emp.id, db)
-        leaderboard.append({
-            'name': emp.nama,
-            'points': game_data['points'],
-            'level': game_data['level'],
-            'is_me': emp.id == employee.id
-        })
-    
-    leaderboard.sort(key=lambda x: x['points'], reverse=True)
+async def handle_leaderboard(query, employee):
+    async with AsyncSessionLocal() as db:
+        leaderboard = await enterprise.calculate_leaderboard(db, limit=10)
+    for item in leaderboard:
+        item['is_me'] = item['employee_id'] == employee.id
     
     text = f"<b>LEADERBOARD</b>\n{create_separator(30)}\n<i>Top 10 Performers</i>\n\n"
     
@@ -798,26 +848,16 @@ async def handle_leaderboard(query, employee, db):
 # ATTENDANCE HANDLERS
 # ==========================================
 
-async def handle_clock_in(query, employee, db):
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    existing = db.query(Absensi).filter(
-        Absensi.employee_id == employee.id,
-        Absensi.tanggal == today
-    ).first()
+async def handle_clock_in(query, employee):
+    # Committed together with concurrent clock-ins (utils.clock_in)
+    now, clocked_in = await clock_in_batcher.clock_in(employee.id)
     
-    if existing and existing.waktu_masuk:
-        text = f"<b>ALREADY CLOCKED IN</b>\n\nTime: {existing.waktu_masuk.strftime('%H:%M:%S')}"
+    if not clocked_in:
+        text = f"<b>ALREADY CLOCKED IN</b>\n\nTime: {now.strftime('%H:%M:%S')}"
         keyboard = [[InlineKeyboardButton("Back", callback_data='attendance')]]
         await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
         return
-    
-    now = datetime.now()
-    if existing:
-        existing.waktu_masuk = now
-        existing.status = 'hadir'
-    else:
-        db.add(Absensi(employee_id=employee.id, tanggal=today, waktu_masuk=now, status='hadir'))
-    db.commit()
+    dashboard_cache.invalidate(employee.id)
     
     is_late = now.hour > 8 or (now.hour == 8 and now.minute > 15)
     status_text = "LATE" if is_late else "ON TIME"
@@ -837,30 +877,27 @@ async def handle_clock_in(query, employee, db):
     keyboard = [[InlineKeyboardButton("Back to Main", callback_data='main_menu')]]
     await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
 
-async def handle_clock_out(query, employee, db):
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    absensi = db.query(Absensi).filter(
-        Absensi.employee_id == employee.id,
-        Absensi.tanggal == today
-    ).first()
+async def handle_clock_out(query, employee):
+    async with AsyncSessionLocal() as db:
+        absensi, status = await clock_out(db, employee.id)
+        # Commit straight away: the guarded UPDATE holds the write lock even when it matched nothing
+        await db.commit()
     
-    if not absensi or not absensi.waktu_masuk:
+    if status == 'not_clocked_in':
         text = "<b>NOT CLOCKED IN YET</b>\n\nPlease clock in first!"
         keyboard = [[InlineKeyboardButton("Clock In", callback_data='clock_in')]]
         await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
         return
     
-    if absensi.waktu_keluar:
+    if status == 'already':
         text = f"<b>ALREADY CLOCKED OUT</b>\n\nTime: {absensi.waktu_keluar.strftime('%H:%M:%S')}"
         keyboard = [[InlineKeyboardButton("Back", callback_data='attendance')]]
         await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
         return
     
-    now = datetime.now()
-    absensi.waktu_keluar = now
+    dashboard_cache.invalidate(employee.id)
+    now = absensi.waktu_keluar
     hours = (now - absensi.waktu_masuk).total_seconds() / 3600
-    absensi.jam_kerja = round(hours, 2)
-    db.commit()
     
     text = (
         f"<b>CLOCK OUT SUCCESS!</b>\n"
@@ -880,9 +917,10 @@ async def handle_clock_out(query, employee, db):
 # OTHER HANDLERS
 # ==========================================
 
-async def handle_analytics(query, employee, db):
-    perf = enterprise.generate_performance_score(employee.id, db)
-    game = enterprise.calculate_gamification(employee.id, db)
+async def handle_analytics(query, employee):
+    async with AsyncSessionLocal() as db:
+        perf = await enterprise.generate_performance_score(employee.id, db)
+        game = await enterprise.calculate_gamification(employee.id, db)
     
     text = (
         f"<b>ANALYTICS DASHBOARD</b>\n"
@@ -902,7 +940,7 @@ async def handle_analytics(query, employee, db):
     keyboard = [[InlineKeyboardButton("Back", callback_data='main_menu')]]
     await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
 
-async def handle_profile(query, employee, db):
+async def handle_profile(query, employee):
     tenure = (datetime.now() - employee.tanggal_bergabung).days
     years = tenure // 365
     months = (tenure % 365) // 30
@@ -926,8 +964,9 @@ async def handle_profile(query, employee, db):
     keyboard = [[InlineKeyboardButton("Back", callback_data='main_menu')]]
     await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
 
-async def handle_alerts(query, employee, db):
-    game = enterprise.calculate_gamification(employee.id, db)
+async def handle_alerts(query, employee):
+    async with AsyncSessionLocal() as db:
+        game = await enterprise.calculate_gamification(employee.id, db)
     
     text = f"<b>SMART ALERTS</b>\n{create_separator(30)}\n\n"
     
@@ -974,32 +1013,90 @@ async def handle_ai_mode(query, employee, context):
 # MESSAGE HANDLER
 # ==========================================
 
+class StreamingReply:
+    """One reply message edited in place while the AI answer streams in.
+    
+    Edits are throttled to one per `interval` seconds (Telegram rate-limits
+    edits per chat) and never overlap; the newest text wins.
+    """
+    
+    def __init__(self, message, interval: float = STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self.sent = None
+        self.text = ""
+        self.shown = ""
+        self.next_edit = 0.0
+        self.task = None
+    
+    async def update(self, text: str):
+        self.text = text
+        if (self.task is None or self.task.done()) and time.monotonic() >= self.next_edit:
+            self.task = asyncio.create_task(self._push())
+    
+    async def _push(self):
+        text = self.text
+        if text == self.shown:
+            return
+        self.next_edit = time.monotonic() + self.interval
+        try:
+            if self.sent is None:
+                self.sent = await self.message.reply_text(f"{text} ...")
+            else:
+                await self.sent.edit_text(f"{text} ...")
+            self.shown = text
+        except RetryAfter as e:
+            self.next_edit = time.monotonic() + e.retry_after
+        except TelegramError as e:
+            logger.warning(f"Streaming edit failed: {e}")
+    
+    async def finish(self, text: str, parse_mode: str = None):
+        """Replace the partial answer with the final formatted one."""
+        if self.task is not None:
+            await self.task
+        for _ in range(2):
+            try:
+                if self.sent is None:
+                    self.sent = await self.message.reply_text(text, parse_mode=parse_mode)
+                else:
+                    await self.sent.edit_text(text, parse_mode=parse_mode)
+                return
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('ai_mode'):
-        db = SessionLocal()
-        try:
-            employee = db.query(Employee).filter(
-                Employee.telegram_user_id == update.effective_user.id
-            ).first()
-            
+        # Runs as its own task (block=False), after the update's own track() has closed
+        with track('ai_chat'):
+            employee = await employee_cache.get(update.effective_user.id)
             if not employee:
                 return
-            
+        
             msg = update.message.text
-            
+        
             if msg.lower() in ['/start', 'menu', 'exit']:
                 context.user_data['ai_mode'] = False
                 await start_command(update, context)
                 return
-            
+        
             await update.message.chat.send_action('typing')
-            
-            result = advanced_rag.chat(
-                query=msg,
-                employee_id=employee.id,
-                user_id=update.effective_user.id
-            )
-            
+        
+            reply = None
+            if AI_STREAMING:
+                reply = StreamingReply(update.message)
+                result = await advanced_rag.astream_chat(
+                    query=msg,
+                    employee_id=employee.id,
+                    user_id=update.effective_user.id,
+                    on_text=reply.update
+                )
+            else:
+                result = await advanced_rag.achat(
+                    query=msg,
+                    employee_id=employee.id,
+                    user_id=update.effective_user.id
+                )
+        
             response = (
                 f"<b>AI Assistant</b>\n"
                 f"{create_separator(30)}\n\n"
@@ -1007,41 +1104,91 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"{create_separator(30)}\n"
                 f"<i>/start to return to menu</i>"
             )
-            await update.message.reply_text(response, parse_mode='HTML')
-        
-        finally:
-            db.close()
+            if reply:
+                await reply.finish(response, parse_mode='HTML')
+            else:
+                await update.message.reply_text(response, parse_mode='HTML')
 
 # ==========================================
 # MAIN
 # ==========================================
 
-def main():
-    logger.info("=" * 60)
-    logger.info(f"BPKH HR v{VERSION} - {DEVELOPER}")
-    logger.info("All Features Fully Clickable & Operational!")
-    logger.info("=" * 60)
-    
-    init_db()
-    
-    app = Application.builder()\
+async def post_init(app: Application):
+    # AI warms up in the background; menus work while it loads
+    advanced_rag.start_background_init()
+    query_metrics.register('bpkh_cache', 'cache', lambda: {
+        'dashboard': dashboard_cache.stats(),
+        'employee': employee_cache.stats(),
+        'answer': answer_cache.stats()
+    })
+    query_metrics.register('bpkh_db_pool', 'engine', pool_stats)
+    query_metrics.register('bpkh_prompt', 'builder', lambda: {'assistant': prompt_builder.stats()})
+    if not WEBHOOK_URL:
+        # In webhook mode the webhook app answers /metrics itself
+        app.bot_data['metrics_server'] = await serve_metrics()
+
+async def post_shutdown(app: Application):
+    logger.info(f"Dashboard cache: {dashboard_cache.stats()}")
+    logger.info(f"Employee cache: {employee_cache.stats()}")
+    logger.info(f"Answer cache: {answer_cache.stats()}")
+    logger.info(f"Prompt sizes: {prompt_builder.stats()}")
+    await clock_in_batcher.close()
+    logger.info(f"Clock-in batches: {clock_in_batcher.stats()}")
+    logger.info(f"Update processing: {app.update_processor.stats()}")
+    logger.info(f"DB pools: {pool_stats()}")
+    if app.bot_data.get('metrics_server'):
+        app.bot_data['metrics_server'].close()
+    await async_engine.dispose()
+
+def build_application(base_url: str = None) -> Application:
+    builder = Application.builder()
+    if base_url:
+        # Another Bot API server (python -m utils.ai_load_test points this at a local stub)
+        builder.base_url(base_url)
+    app = builder\
         .token(TELEGRAM_BOT_TOKEN)\
         .connect_timeout(60)\
         .read_timeout(60)\
         .write_timeout(60)\
         .pool_timeout(60)\
+        .concurrent_updates(PerChatUpdateProcessor(CONCURRENT_UPDATES))\
+        .post_init(post_init)\
+        .post_shutdown(post_shutdown)\
         .build()
     
     app.add_handler(CommandHandler('start', start_command))
     app.add_handler(CommandHandler('register', register_command))
     app.add_handler(CallbackQueryHandler(button_handler))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
+    # block=False: AI chats run as tasks so a slow LLM round-trip does not hold a worker slot.
+    # This deliberately takes them out of PerChatUpdateProcessor's per-chat ordering (a user's
+    # next message or button can run while the answer is still streaming) and out of the
+    # per-update totals, so message_handler records its own under "ai_chat".
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler, block=False))
+    return app
+
+def main():
+    if '--profile-startup' in sys.argv:
+        from utils.startup_profile import main as profile_startup
+        profile_startup([arg for arg in sys.argv[1:] if arg != '--profile-startup'])
+        return
+    
+    logger.info("=" * 60)
+    logger.info(f"BPKH HR v{VERSION} - {DEVELOPER}")
+    logger.info("All Features Fully Clickable & Operational!")
+    logger.info("=" * 60)
+    
+    init_db()
+    app = build_application()
     
     logger.info("Bot running - All systems operational!")
     logger.info("=" * 60)
     
     try:
-        app.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+        if WEBHOOK_URL:
+            from utils.webhook import run_webhook
+            run_webhook(app)
+        else:
+            app.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
 
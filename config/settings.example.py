@@ -6,3 +6,96 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_TOKEN_HERE')
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./bpkh.db')
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+# Knowledge base search
+KB_INDEX_REFRESH_SECONDS = float(os.getenv('KB_INDEX_REFRESH_SECONDS', '30'))
+
+# LLM (Groq)
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+
+# Main menu dashboard cache
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '300'))
+DASHBOARD_CACHE_SIZE = int(os.getenv('DASHBOARD_CACHE_SIZE', '2048'))
+
+# Dense retrieval (CPU sentence-transformer)
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+DENSE_MIN_SCORE = float(os.getenv('DENSE_MIN_SCORE', '0.3'))
+
+# Hybrid retrieval (reciprocal rank fusion of BM25 + dense)
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '20'))
+
+# LLM answer cache (ANSWER_CACHE_SIMILARITY=0 disables near-duplicate matching)
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '1024'))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.92'))
+
+# Stream AI answers as progressive message edits
+AI_STREAMING = os.getenv('AI_STREAMING', 'true').lower() == 'true'
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+
+# AI conversation history: memory | sql | redis
+HISTORY_BACKEND = os.getenv('HISTORY_BACKEND', 'memory')
+HISTORY_MAX_MESSAGES = int(os.getenv('HISTORY_MAX_MESSAGES', '10'))
+HISTORY_IDLE_SECONDS = int(os.getenv('HISTORY_IDLE_SECONDS', '3600'))
+HISTORY_MAX_USERS = int(os.getenv('HISTORY_MAX_USERS', '20000'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# Prompt size (estimated tokens)
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '1200'))
+PROMPT_KB_TOKENS = int(os.getenv('PROMPT_KB_TOKENS', '600'))
+PROMPT_HISTORY_MESSAGES = int(os.getenv('PROMPT_HISTORY_MESSAGES', '3'))
+
+# KB chunking (estimated tokens per passage)
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', '200'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '40'))
+
+# Ingestion (python -m utils.ingest)
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '50'))
+
+# Chroma (RAGEngine) writes per batch
+CHROMA_BATCH_SIZE = int(os.getenv('CHROMA_BATCH_SIZE', '128'))
+
+# Seconds an AI request waits for background initialisation
+AI_READY_TIMEOUT = float(os.getenv('AI_READY_TIMEOUT', '60'))
+
+# Startup profiling (python bot.py --profile-startup)
+STARTUP_BUDGET_SECONDS = float(os.getenv('STARTUP_BUDGET_SECONDS', '5'))
+
+# Database connection pool (PostgreSQL); SQLite keeps SQLAlchemy's default pool
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+
+# SQLite pragmas applied on every new connection
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+# Clock-in group commit: wait this long to collect concurrent clock-ins, up to CLOCK_IN_BATCH_SIZE per transaction
+CLOCK_IN_BATCH_WINDOW = float(os.getenv('CLOCK_IN_BATCH_WINDOW', '0.01'))
+CLOCK_IN_BATCH_SIZE = int(os.getenv('CLOCK_IN_BATCH_SIZE', '200'))
+
+# Webhook mode (used instead of polling when WEBHOOK_URL is set); the ASGI app listens on WEBHOOK_LISTEN:WEBHOOK_PORT.
+# WEBHOOK_SECRET is required in webhook mode and must be the same on every replica
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+
+# Handlers running at the same time; updates from one chat always run in order
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '8'))
+
+# Employee lookup cache (telegram_user_id -> employee snapshot); unregistered users only for NEGATIVE_TTL (0 disables)
+EMPLOYEE_CACHE_SIZE = int(os.getenv('EMPLOYEE_CACHE_SIZE', '4096'))
+EMPLOYEE_CACHE_TTL = int(os.getenv('EMPLOYEE_CACHE_TTL', '600'))
+EMPLOYEE_CACHE_NEGATIVE_TTL = float(os.getenv('EMPLOYEE_CACHE_NEGATIVE_TTL', '5'))
+
+# Query instrumentation: statements slower than this are logged with their plan;
+# when polling, Prometheus metrics are served on http://METRICS_HOST:METRICS_PORT/metrics (0 disables);
+# in webhook mode they are on the webhook app's /metrics, for local clients only
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', '0.2'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
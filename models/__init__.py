@@ -1,12 +1,16 @@
 """Database models package."""
-from .database import Base, engine, SessionLocal, init_db
+from .database import Base, engine, SessionLocal, async_engine, AsyncSessionLocal, init_db, pool_stats
 from .employee import Employee
 from .cuti import Cuti
 from .absensi import Absensi
 from .payroll import Payroll
 from .knowledge_base import KnowledgeBase
+from .knowledge_chunk import KnowledgeChunk
+from .attendance_stats import AttendanceStats
+from .conversation import ConversationMessage
 
 __all__ = [
-    'Base', 'engine', 'SessionLocal', 'init_db',
-    'Employee', 'Cuti', 'Absensi', 'Payroll', 'KnowledgeBase'
+    'Base', 'engine', 'SessionLocal', 'async_engine', 'AsyncSessionLocal', 'init_db', 'pool_stats',
+    'Employee', 'Cuti', 'Absensi', 'Payroll', 'KnowledgeBase', 'KnowledgeChunk',
+    'AttendanceStats', 'ConversationMessage'
 ]
@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
-from sqlalchemy import Column, Integer, DateTime, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, DateTime, String, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
 
 class Absensi(Base):
     __tablename__ = 'absensi'
+    __table_args__ = (
+        Index('uq_absensi_employee_tanggal', 'employee_id', 'tanggal', unique=True),
+        Index('ix_absensi_tanggal', 'tanggal'),
+    )
     id = Column(Integer, primary_key=True)
     employee_id = Column(Integer, ForeignKey('employees.id'))
     tanggal = Column(DateTime)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import Column, Integer, DateTime, String, Float, Text, ForeignKey
+from datetime import datetime
+from .database import Base
+
+class AttendanceStats(Base):
+    """Ringkasan absensi 90 hari terakhir per karyawan.
+
+    `days` holds one slot per calendar day ending at `as_of` (oldest first) and
+    `hours` the matching jam_kerja values; the counters are derived from them
+    (30-day window for gamification, 90-day for performance) on every write.
+    """
+    __tablename__ = 'attendance_stats'
+    employee_id = Column(Integer, ForeignKey('employees.id'), primary_key=True)
+    as_of = Column(DateTime)
+    days = Column(String(90))
+    hours = Column(Text)
+    total_30 = Column(Integer, default=0)
+    hadir_30 = Column(Integer, default=0)
+    on_time_30 = Column(Integer, default=0)
+    current_streak = Column(Integer, default=0)
+    max_streak_30 = Column(Integer, default=0)
+    streak_bonus_30 = Column(Integer, default=0)
+    total_90 = Column(Integer, default=0)
+    hadir_90 = Column(Integer, default=0)
+    on_time_90 = Column(Integer, default=0)
+    total_hours_90 = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
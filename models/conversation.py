@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import Column, Integer, BigInteger, DateTime, String, Text, Index
+from datetime import datetime
+from .database import Base
+
+class ConversationMessage(Base):
+    """Riwayat chat AI per user Telegram (HISTORY_BACKEND=sql)."""
+    __tablename__ = 'conversation_messages'
+    __table_args__ = (
+        Index('ix_conversation_user_id', 'user_id', 'id'),
+        Index('ix_conversation_created_at', 'created_at'),
+    )
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)
+    role = Column(String(20))
+    content = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
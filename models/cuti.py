@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
 
 class Cuti(Base):
     __tablename__ = 'cuti'
+    __table_args__ = (
+        Index('ix_cuti_employee_status', 'employee_id', 'status'),
+    )
     id = Column(Integer, primary_key=True)
     employee_id = Column(Integer, ForeignKey('employees.id'))
     jenis_cuti = Column(String(50))
@@ -1,12 +1,125 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from config.settings import DATABASE_URL
+from sqlalchemy.pool import QueuePool
+from config.settings import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS
+)
+import threading
 
-engine = create_engine(DATABASE_URL, echo=False)
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+def to_async_url(url):
+    """Map a sync DATABASE_URL onto its asyncio driver (aiosqlite/asyncpg)."""
+    scheme, sep, rest = url.partition('://')
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+def engine_options(url):
+    """Pool settings for server databases; SQLite keeps SQLAlchemy's default pool."""
+    if is_sqlite(url):
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run during a write; busy_timeout makes writers wait instead of failing."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+class PoolMetrics:
+    """Checkout/connect counters for one engine's pool, fed by pool events."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidated = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidated += 1
+
+    def stats(self) -> dict:
+        pool = self.engine.pool
+        capacity = pool.size() + max(pool._max_overflow, 0) if isinstance(pool, QueuePool) else None
+        return {
+            'pool': type(pool).__name__,
+            'checked_out': self.checked_out,
+            'peak_checked_out': self.peak_checked_out,
+            'capacity': capacity,
+            'utilisation': round(self.checked_out / capacity, 2) if capacity else None,
+            'connects': self.connects,
+            'checkouts': self.checkouts,
+            'invalidated': self.invalidated,
+            'status': pool.status(),
+        }
+
+engine = create_engine(DATABASE_URL, echo=False, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Used by the bot handlers so queries never block the event loop
+async_engine = create_async_engine(to_async_url(DATABASE_URL), echo=False, **engine_options(DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if is_sqlite(DATABASE_URL):
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, 'connect', set_sqlite_pragmas)
+
+pool_metrics = {
+    'sync': PoolMetrics(engine),
+    'async': PoolMetrics(async_engine.sync_engine),
+}
+
+def pool_stats() -> dict:
+    """Pool utilisation of the sync and async engines."""
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
+
 Base = declarative_base()
 
 def init_db():
     import models.employee
+    from .migrations import upgrade_schema
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
@@ -11,5 +11,8 @@ class KnowledgeBase(Base):
     judul = Column(String(200))
     konten = Column(Text)
     tags = Column(String(500))
+    # Set for entries loaded by `python -m utils.ingest`
+    source_path = Column(String(500), index=True)
+    source_hash = Column(String(64))
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
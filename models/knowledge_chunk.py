@@ -0,0 +1,32 @@
+"""Knowledge base chunk model."""
+from sqlalchemy import Column, Integer, String, Text, DateTime, LargeBinary, ForeignKey, Index
+from datetime import datetime
+from .database import Base
+
+class KnowledgeChunk(Base):
+    """Potongan konten KnowledgeBase yang diindeks untuk retrieval.
+
+    `id` is "<knowledge_base_id>-<content hash prefix>" (rows from before
+    that use "<knowledge_base_id>-<ordinal>"); re-chunking an edited entry
+    matches rows by `content_hash`, so unchanged passages keep their row and
+    embedding wherever they moved, and only `ordinal` follows. `judul` and `tags` are
+    copied from the parent so the indexes can use a chunk like an entry.
+    `updated_at` only changes when `content_hash` does. `embedding` caches
+    the float32 vector from `embedding_model` and is cleared on change.
+    """
+    __tablename__ = 'knowledge_chunks'
+    __table_args__ = (
+        Index('ix_knowledge_chunks_kb_ordinal', 'knowledge_base_id', 'ordinal'),
+    )
+
+    id = Column(String(64), primary_key=True)
+    knowledge_base_id = Column(Integer, ForeignKey('knowledge_base.id', ondelete='CASCADE'), nullable=False)
+    ordinal = Column(Integer, nullable=False)
+    judul = Column(String(200))
+    konten = Column(Text)
+    tags = Column(String(500))
+    content_hash = Column(String(64))
+    source_updated_at = Column(DateTime)
+    embedding = Column(LargeBinary)
+    embedding_model = Column(String(200))
+    updated_at = Column(DateTime, default=datetime.now)
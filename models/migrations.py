@@ -0,0 +1,188 @@
+"""Schema upgrades for databases created before the current models.
+
+`create_all` only creates missing tables, so columns and indexes added to
+existing tables are applied here. New columns must be nullable. Run `python -m models.migrations` to upgrade a
+database and print the query plans of the hot lookups.
+
+A unique index cannot be built over duplicate rows. upgrade_schema never
+deletes them; it raises DuplicateRowsError instead, and
+
+    python -m models.migrations --dedupe                         # report only
+    python -m models.migrations --dedupe --apply --keep oldest   # or newest
+
+lists them and, with --apply, deletes all but one row per key.
+"""
+from sqlalchemy import bindparam, inspect, text
+from .database import Base, engine, init_db
+from itertools import groupby
+import argparse
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Keys of the unique indexes that existing data may violate
+UNIQUE_KEYS = {
+    'absensi': ('employee_id', 'tanggal'),
+    'payroll': ('employee_id', 'periode'),
+}
+
+# name -> (sql, params, index expected in the plan)
+HOT_QUERIES = {
+    'absensi_today': (
+        "SELECT * FROM absensi WHERE employee_id = :employee_id AND tanggal = :tanggal",
+        {'employee_id': 1, 'tanggal': '2025-01-01 00:00:00'},
+        'uq_absensi_employee_tanggal'
+    ),
+    'absensi_window': (
+        "SELECT employee_id, status FROM absensi WHERE tanggal >= :tanggal",
+        {'tanggal': '2025-01-01 00:00:00'},
+        'ix_absensi_tanggal'
+    ),
+    'payroll_periode': (
+        "SELECT * FROM payroll WHERE employee_id = :employee_id AND periode = :periode",
+        {'employee_id': 1, 'periode': '2025-01'},
+        'uq_payroll_employee_periode'
+    ),
+    'cuti_status': (
+        "SELECT * FROM cuti WHERE employee_id = :employee_id AND status = :status",
+        {'employee_id': 1, 'status': 'pending'},
+        'ix_cuti_employee_status'
+    ),
+}
+
+
+class DuplicateRowsError(RuntimeError):
+    """Existing rows violate a unique index that upgrade_schema has to build."""
+
+
+def find_duplicates(conn, table: str, columns: tuple) -> list:
+    """[(key values, ids oldest first)] for every key held by more than one row."""
+    key = ', '.join(columns)
+    join = ' AND '.join(f"t.{column} = d.{column}" for column in columns)
+    rows = conn.execute(text(
+        f"SELECT t.id, {', '.join(f't.{column}' for column in columns)} FROM {table} t "
+        f"JOIN (SELECT {key} FROM {table} GROUP BY {key} HAVING COUNT(*) > 1) d ON {join} "
+        f"ORDER BY {', '.join(f't.{column}' for column in columns)}, t.id"
+    )).all()
+    return [(values, [row[0] for row in group]) for values, group in groupby(rows, key=lambda row: tuple(row[1:]))]
+
+
+def remove_duplicates(conn, table: str, columns: tuple, keep: str) -> int:
+    """Delete all but the oldest or newest (by id) row of each duplicated key."""
+    doomed = []
+    for values, ids in find_duplicates(conn, table, columns):
+        doomed += ids[1:] if keep == 'oldest' else ids[:-1]
+    if doomed:
+        conn.execute(text(f"DELETE FROM {table} WHERE id IN :ids").bindparams(bindparam('ids', expanding=True)), {'ids': doomed})
+        logger.warning(f"Removed {len(doomed)} duplicate {table} rows on ({', '.join(columns)}), kept the {keep}")
+    return len(doomed)
+
+
+def add_missing_columns(conn, table, existing: set):
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        logger.info(f"Added column {table.name}.{column.name}")
+
+
+def upgrade_schema(bind=engine):
+    """Create columns and indexes declared on the models that the database is missing."""
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        tables = set(inspector.get_table_names())
+
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+
+            add_missing_columns(conn, table, {column['name'] for column in inspector.get_columns(table.name)})
+
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                if index.unique and table.name in UNIQUE_KEYS:
+                    duplicates = find_duplicates(conn, table.name, UNIQUE_KEYS[table.name])
+                    if duplicates:
+                        raise DuplicateRowsError(
+                            f"{len(duplicates)} ({', '.join(UNIQUE_KEYS[table.name])}) keys in {table.name} have "
+                            f"more than one row, so {index.name} cannot be created. Review them with "
+                            f"`python -m models.migrations --dedupe`"
+                        )
+                index.create(conn)
+                logger.info(f"Created index {index.name} on {table.name}")
+
+
+def explain(conn, sql: str, params: dict) -> str:
+    if conn.dialect.name == 'sqlite':
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params)
+        return '\n'.join(row[-1] for row in rows)
+    return '\n'.join(row[0] for row in conn.execute(text(f"EXPLAIN {sql}"), params))
+
+
+def check_query_plans(bind=engine) -> dict:
+    """EXPLAIN each hot query; returns {name: (uses_expected_index, plan)}."""
+    results = {}
+    with bind.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Tiny tables are cheaper to seq-scan; ask whether the index is usable at all.
+            conn.execute(text("SET enable_seqscan = off"))
+        for name, (sql, params, index_name) in HOT_QUERIES.items():
+            plan = explain(conn, sql, params)
+            results[name] = (index_name in plan, plan)
+        conn.rollback()
+    return results
+
+
+def dedupe(apply: bool = False, keep: str = None, bind=engine) -> int:
+    """Print the rows blocking the unique indexes and, with `apply`, delete all but one per key."""
+    total = 0
+    with bind.begin() as conn:
+        tables = set(inspect(conn).get_table_names())
+        for table, columns in UNIQUE_KEYS.items():
+            if table not in tables:
+                continue
+            duplicates = find_duplicates(conn, table, columns)
+            print(f"{table} ({', '.join(columns)}): {len(duplicates)} duplicated keys")
+            for values, ids in duplicates:
+                print(f"    {values}: ids {ids}")
+                total += len(ids) - 1
+            if apply:
+                remove_duplicates(conn, table, columns, keep)
+
+    if apply:
+        print(f"OK removed {total} duplicate rows, kept the {keep} row of each key")
+    elif total:
+        print(f"DRY RUN {total} rows would be removed; rerun with --apply --keep oldest|newest")
+    else:
+        print("OK no duplicate rows")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dedupe', action='store_true', help='list rows that block the unique indexes')
+    parser.add_argument('--apply', action='store_true', help='with --dedupe, delete them')
+    parser.add_argument('--keep', choices=['oldest', 'newest'], help='row kept per key when applying')
+    args = parser.parse_args()
+    if args.apply and not (args.dedupe and args.keep):
+        parser.error("--apply needs --dedupe and --keep")
+
+    logging.basicConfig(level=logging.INFO)
+    if args.dedupe:
+        dedupe(args.apply, args.keep)
+        return
+    init_db()
+
+    failed = False
+    for name, (ok, plan) in check_query_plans().items():
+        print(f"[{'OK' if ok else 'FULL SCAN'}] {name}\n    {plan}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
-from sqlalchemy import Column, Integer, Float, DateTime, String, Text, ForeignKey
+from sqlalchemy import Column, Integer, Float, DateTime, String, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
 
 class Payroll(Base):
     __tablename__ = 'payroll'
+    __table_args__ = (
+        Index('uq_payroll_employee_periode', 'employee_id', 'periode', unique=True),
+    )
     id = Column(Integer, primary_key=True)
     employee_id = Column(Integer, ForeignKey('employees.id'))
     periode = Column(String(7))
@@ -1,4 +1,5 @@
 import os
+import asyncio
 import logging
 from datetime import datetime, date
 from dotenv import load_dotenv
@@ -647,7 +648,8 @@ Silakan ketik pertanyaan Anda...
         await update.message.reply_text("🤔 Sedang mencari jawaban...")
         
         try:
-            answer = rag_engine.query(question)
+            # Off the event loop: the engine may still be loading (see preload in main)
+            answer = await asyncio.to_thread(rag_engine.query, question)
             await update.message.reply_text(
                 f"💬 *Jawaban AI:*\n\n{answer}\n\n_Ketik /start untuk kembali ke menu_",
                 parse_mode='Markdown'
@@ -699,16 +701,19 @@ def main():
     # Initialize database
     init_db()
     
-    # Initialize RAG with default knowledge
-    print("Initializing RAG Engine...")
-    rag_engine.initialize_knowledge_base(DEFAULT_KNOWLEDGE)
-    print("RAG Engine ready!")
+    # Load the RAG engine and sync the default knowledge in the background,
+    # so polling starts right away
+    print("Loading RAG Engine in the background...")
+    rag_engine.preload(DEFAULT_KNOWLEDGE)
     
     # Create bot instance
     bot = SDMBot()
     
     # Create application
-    application = Application.builder().token(os.getenv('TELEGRAM_BOT_TOKEN')).build()
+    application = Application.builder()\
+        .token(os.getenv('TELEGRAM_BOT_TOKEN'))\
+        .concurrent_updates(int(os.getenv('CONCURRENT_UPDATES', '1')))\
+        .build()
     
     # Add handlers
     application.add_handler(CommandHandler("start", bot.start))
@@ -724,9 +729,23 @@ def main():
     )
     application.add_handler(ai_conv_handler)
     
-    # Start the bot
+    # Start the bot (webhook when WEBHOOK_URL is set, e.g. behind a load balancer)
     print("Bot is running...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    webhook_url = os.getenv('WEBHOOK_URL')
+    if webhook_url:
+        if not os.getenv('WEBHOOK_SECRET'):
+            raise RuntimeError("WEBHOOK_SECRET is not set; without it anyone who finds the URL can post updates")
+        from urllib.parse import urlparse
+        application.run_webhook(
+            listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+            port=int(os.getenv('WEBHOOK_PORT', '8443')),
+            url_path=urlparse(webhook_url).path.lstrip('/'),
+            webhook_url=webhook_url,
+            secret_token=os.getenv('WEBHOOK_SECRET'),
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
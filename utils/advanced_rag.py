@@ -1,24 +1,87 @@
 """Advanced RAG with semantic search and agentic behavior."""
-from models import SessionLocal, KnowledgeBase, Employee, Payroll
-from groq import Groq
-from config.settings import GROQ_API_KEY
+from models import SessionLocal, Employee, Payroll
+from utils.kb_index import kb_index, tokenize
+from utils.vector_index import dense_index
+from utils.hybrid_search import hybrid_retriever
+from utils.answer_cache import answer_cache
+from utils.history_store import create_history_store
+from utils.prompt_builder import prompt_builder
+from config.settings import GROQ_API_KEY, LLM_MAX_CONCURRENCY, AI_READY_TIMEOUT
+import asyncio
 import logging
+import threading
+import time
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = """Asisten HR BPKH (Badan Pengelola Keuangan Haji).
+
+Knowledge Base:
+{kb_context}
+
+{emp_context}
+
+RULES:
+- Jawab SINGKAT (max 3 kalimat)
+- Bahasa Indonesia profesional
+- Jika perlu aksi, suggest menu
+- Jangan buat info palsu"""
+
 class AdvancedRAG:
     """Advanced RAG with agentic capabilities."""
     
     def __init__(self):
+        # Groq clients, KB indexes and the embedding model are set up by
+        # initialize(), off the import path (see start_background_init)
+        self.client = None
+        self.async_client = None
+        self.llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        self.model = "llama-3.1-8b-instant"
+        self.history = create_history_store()
+        self.initialized = False
+        self._init_lock = threading.Lock()
+        self._init_task = None
+    
+    def initialize(self):
+        """Create the Groq clients and warm the KB indexes (blocking, idempotent)."""
+        if self.initialized:
+            return
+        with self._init_lock:
+            if self.initialized:
+                return
+            start = time.perf_counter()
+            try:
+                from groq import Groq, AsyncGroq
+                self.client = Groq(api_key=GROQ_API_KEY)
+                self.async_client = AsyncGroq(api_key=GROQ_API_KEY)
+            except Exception as e:
+                logger.error(f"Failed to initialize RAG: {e}")
+            
+            for warm_up in (kb_index.refresh, dense_index.refresh):
+                try:
+                    warm_up()
+                except Exception as e:
+                    logger.error(f"KB index warm-up failed: {e}")
+            
+            self.initialized = True
+            logger.info(f"Advanced RAG initialized in {time.perf_counter() - start:.1f}s")
+    
+    def start_background_init(self) -> asyncio.Task:
+        """Run initialize() in a worker thread; the task doubles as the readiness future."""
+        if self._init_task is None:
+            self._init_task = asyncio.get_running_loop().create_task(asyncio.to_thread(self.initialize))
+        return self._init_task
+    
+    async def wait_ready(self, timeout: float = AI_READY_TIMEOUT) -> bool:
+        """Wait for background initialisation; False if it is still running after `timeout`."""
+        if self.initialized:
+            return True
         try:
-            self.client = Groq(api_key=GROQ_API_KEY)
-            self.model = "llama-3.1-8b-instant"
-            self.conversation_history = {}
-            logger.info("Advanced RAG initialized")
-        except Exception as e:
-            logger.error(f"Failed to initialize RAG: {e}")
-            self.client = None
+            await asyncio.wait_for(asyncio.shield(self.start_background_init()), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
     
     def expand_query(self, query: str) -> list:
         """Expand query dengan synonyms."""
@@ -38,32 +101,22 @@ class AdvancedRAG:
         
         return list(set(expanded_terms))
     
+    def query_terms(self, query: str) -> list:
+        """Expanded query as index tokens."""
+        terms = []
+        for term in self.expand_query(query):
+            terms.extend(tokenize(term))
+        return terms
+    
     def semantic_search_kb(self, query: str, top_k: int = 3) -> list:
-        """Search KB with semantic matching."""
-        db = SessionLocal()
-        try:
-            kb_entries = db.query(KnowledgeBase).all()
-            expanded_terms = self.expand_query(query)
-            
-            scored_entries = []
-            for entry in kb_entries:
-                score = 0
-                entry_text = f"{entry.judul} {entry.konten} {entry.tags}".lower()
-                
-                for term in expanded_terms:
-                    score += entry_text.count(term)
-                
-                if any(term in entry.judul.lower() for term in expanded_terms):
-                    score += 5
-                
-                if score > 0:
-                    scored_entries.append({'entry': entry, 'score': score})
-            
-            scored_entries.sort(key=lambda x: x['score'], reverse=True)
-            return [item['entry'] for item in scored_entries[:top_k]]
-            
-        finally:
-            db.close()
+        """Hybrid search: BM25 and dense rankings fused with RRF."""
+        return [
+            entry for entry, score in hybrid_retriever.search(query, self.query_terms(query), top_k=top_k)
+        ]
+    
+    def keyword_search_kb(self, query: str, top_k: int = 3) -> list:
+        """BM25 search over the inverted index (fallback without embeddings)."""
+        return [entry for entry, score in kb_index.search(self.query_terms(query), top_k=top_k)]
     
     def get_employee_context(self, employee_id: int) -> str:
         """Get employee data for personalization."""
@@ -113,26 +166,102 @@ class AdvancedRAG:
     
     def add_to_history(self, user_id: int, role: str, content: str):
         """Add to conversation history."""
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
-        
-        self.conversation_history[user_id].append({
-            'role': role,
-            'content': content,
-            'timestamp': datetime.now()
-        })
-        
-        if len(self.conversation_history[user_id]) > 10:
-            self.conversation_history[user_id] = self.conversation_history[user_id][-10:]
+        self.history.append(user_id, role, content)
     
     def get_history(self, user_id: int, limit: int = 5) -> list:
         """Get conversation history."""
-        if user_id not in self.conversation_history:
-            return []
-        return self.conversation_history[user_id][-limit:]
+        return self.history.get(user_id, limit)
+    
+    def build_messages(self, query: str, employee_id: int = None, user_id: int = None) -> tuple:
+        """Retrieve KB/employee context and assemble the LLM messages.
+        
+        Returns (intent_data, kb_results, messages, cache_scope). Every prompt
+        for an employee carries their context, so it is cached under
+        ('employee', id); a prompt with only conversation history under
+        ('user', id). Only prompts without either share scope None.
+        """
+        intent_data = self.detect_intent(query)
+        kb_results = self.semantic_search_kb(query, top_k=2)
+        
+        emp_context = ""
+        if employee_id:
+            emp_context = self.get_employee_context(employee_id)
+        
+        history = []
+        if user_id:
+            history = self.get_history(user_id)
+        
+        messages = prompt_builder.build(
+            SYSTEM_PROMPT,
+            query=query,
+            terms=self.query_terms(query),
+            kb_entries=kb_results,
+            emp_context=emp_context,
+            history=history
+        )
+        
+        if employee_id:
+            scope = ('employee', employee_id)
+        elif history:
+            scope = ('user', user_id)
+        else:
+            scope = None
+        return intent_data, kb_results, messages, scope
+    
+    def log_usage(self, response):
+        """Token counts reported by Groq for one completion."""
+        usage = getattr(response, 'usage', None)
+        if usage:
+            logger.info(f"LLM usage: prompt {usage.prompt_tokens}, completion {usage.completion_tokens} tokens")
+    
+    def finalize_response(self, query: str, user_id: int, intent_data: dict, kb_results: list, ai_response: str) -> dict:
+        """Attach suggested action, record history and build the result."""
+        suggested_action = None
+        if intent_data['has_intent']:
+            intent = intent_data['primary_intent']
+            actions = {
+                'payroll': 'Untuk detail gaji, klik menu: Payroll',
+                'cuti': 'Untuk cuti, klik menu: Cuti',
+                'absensi': 'Untuk absensi, klik menu: Absensi',
+                'info': 'Untuk info lengkap, klik menu: Info'
+            }
+            suggested_action = actions.get(intent)
+        
+        if user_id:
+            self.add_to_history(user_id, 'user', query)
+            self.add_to_history(user_id, 'assistant', ai_response)
+        
+        final_response = ai_response
+        if suggested_action:
+            final_response += f"\n\n[TIP] {suggested_action}"
+        
+        return {
+            'response': final_response,
+            'sources': list(dict.fromkeys(entry.judul for entry in kb_results)),
+            'intent': intent_data['primary_intent'],
+            'action': suggested_action
+        }
+    
+    def fallback_response(self, query: str) -> dict:
+        """KB-only answer when the LLM call fails."""
+        kb_results = self.semantic_search_kb(query, top_k=1)
+        if kb_results:
+            entry = kb_results[0]
+            return {
+                'response': f"{entry.judul}: {entry.konten}",
+                'sources': [entry.judul],
+                'action': None
+            }
+        
+        return {
+            'response': 'Maaf, tidak bisa menjawab. Gunakan menu.',
+            'sources': [],
+            'action': None
+        }
     
     def chat(self, query: str, employee_id: int = None, user_id: int = None) -> dict:
         """Advanced RAG chat."""
+        self.initialize()
         if not self.client:
             return {
                 'response': 'AI Assistant tidak tersedia.',
@@ -141,93 +270,124 @@ class AdvancedRAG:
             }
         
         try:
-            intent_data = self.detect_intent(query)
-            kb_results = self.semantic_search_kb(query, top_k=2)
+            intent_data, kb_results, messages, scope = self.build_messages(query, employee_id, user_id)
             
-            emp_context = ""
-            if employee_id:
-                emp_context = self.get_employee_context(employee_id)
-            
-            history = []
-            if user_id:
-                history = self.get_history(user_id)
-            
-            kb_context = "\n\n".join([
-                f"{entry.judul}: {entry.konten}" 
-                for entry in kb_results
-            ]) if kb_results else "Tidak ada info dari KB."
-            
-            system_prompt = f"""Asisten HR BPKH (Badan Pengelola Keuangan Haji).
-
-Knowledge Base:
-{kb_context}
-
-{emp_context if emp_context else ''}
-
-RULES:
-- Jawab SINGKAT (max 3 kalimat)
-- Bahasa Indonesia profesional
-- Jika perlu aksi, suggest menu
-- Jangan buat info palsu"""
-            
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            for msg in history[-3:]:
-                messages.append({"role": msg['role'], "content": msg['content']})
+            # Personalised answers stay per employee (see build_messages)
+            ai_response = answer_cache.get(query, kb_results, scope=scope)
+            if ai_response is None:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=200
+                )
+                
+                ai_response = response.choices[0].message.content
+                self.log_usage(response)
+                answer_cache.set(query, kb_results, ai_response, scope=scope)
             
-            messages.append({"role": "user", "content": query})
+            return self.finalize_response(query, user_id, intent_data, kb_results, ai_response)
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.3,
-                max_tokens=200
+        except Exception as e:
+            logger.error(f"RAG error: {e}")
+            return self.fallback_response(query)
+    
+    async def achat(self, query: str, employee_id: int = None, user_id: int = None) -> dict:
+        """Non-blocking chat for the bot event loop.
+        
+        Retrieval and DB lookups run in a worker thread, the Groq call goes
+        through AsyncGroq, and at most LLM_MAX_CONCURRENCY completions are
+        in flight at once.
+        """
+        if not await self.wait_ready():
+            return {
+                'response': 'AI Assistant sedang disiapkan, silakan coba lagi sebentar.',
+                'sources': [],
+                'action': None
+            }
+        if not self.async_client:
+            return {
+                'response': 'AI Assistant tidak tersedia.',
+                'sources': [],
+                'action': None
+            }
+        
+        try:
+            intent_data, kb_results, messages, scope = await asyncio.to_thread(
+                self.build_messages, query, employee_id, user_id
             )
             
-            ai_response = response.choices[0].message.content
-            
-            suggested_action = None
-            if intent_data['has_intent']:
-                intent = intent_data['primary_intent']
-                actions = {
-                    'payroll': 'Untuk detail gaji, klik menu: Payroll',
-                    'cuti': 'Untuk cuti, klik menu: Cuti',
-                    'absensi': 'Untuk absensi, klik menu: Absensi',
-                    'info': 'Untuk info lengkap, klik menu: Info'
-                }
-                suggested_action = actions.get(intent)
-            
-            if user_id:
-                self.add_to_history(user_id, 'user', query)
-                self.add_to_history(user_id, 'assistant', ai_response)
-            
-            final_response = ai_response
-            if suggested_action:
-                final_response += f"\n\n[TIP] {suggested_action}"
+            ai_response = await asyncio.to_thread(answer_cache.get, query, kb_results, scope)
+            if ai_response is None:
+                async with self.llm_semaphore:
+                    response = await self.async_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.3,
+                        max_tokens=200
+                    )
+                
+                ai_response = response.choices[0].message.content
+                self.log_usage(response)
+                await asyncio.to_thread(answer_cache.set, query, kb_results, ai_response, scope)
             
-            return {
-                'response': final_response,
-                'sources': [entry.judul for entry in kb_results],
-                'intent': intent_data['primary_intent'],
-                'action': suggested_action
-            }
+            return await asyncio.to_thread(
+                self.finalize_response, query, user_id, intent_data, kb_results, ai_response
+            )
             
         except Exception as e:
             logger.error(f"RAG error: {e}")
-            
-            kb_results = self.semantic_search_kb(query, top_k=1)
-            if kb_results:
-                entry = kb_results[0]
-                return {
-                    'response': f"{entry.judul}: {entry.konten}",
-                    'sources': [entry.judul],
-                    'action': None
-                }
-            
+            return await asyncio.to_thread(self.fallback_response, query)
+
+    async def astream_chat(self, query: str, employee_id: int = None, user_id: int = None, on_text=None) -> dict:
+        """Streaming variant of achat.
+        
+        `on_text(text)` is awaited with the answer so far each time the Groq
+        stream delivers content, so the caller can show it before the
+        completion finishes. Falls back to achat if the stream fails.
+        """
+        if not await self.wait_ready():
             return {
-                'response': 'Maaf, tidak bisa menjawab. Gunakan menu.',
+                'response': 'AI Assistant sedang disiapkan, silakan coba lagi sebentar.',
                 'sources': [],
                 'action': None
             }
+        if not self.async_client:
+            return await self.achat(query, employee_id, user_id)
+        
+        try:
+            intent_data, kb_results, messages, scope = await asyncio.to_thread(
+                self.build_messages, query, employee_id, user_id
+            )
+            
+            ai_response = await asyncio.to_thread(answer_cache.get, query, kb_results, scope)
+            if ai_response is None:
+                ai_response = ""
+                async with self.llm_semaphore:
+                    stream = await self.async_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.3,
+                        max_tokens=200,
+                        stream=True
+                    )
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            ai_response += delta
+                            if on_text:
+                                await on_text(ai_response)
+                
+                if not ai_response:
+                    raise ValueError("empty completion stream")
+                await asyncio.to_thread(answer_cache.set, query, kb_results, ai_response, scope)
+            
+            return await asyncio.to_thread(
+                self.finalize_response, query, user_id, intent_data, kb_results, ai_response
+            )
+            
+        except Exception as e:
+            logger.warning(f"RAG stream error, retrying without streaming: {e}")
+            return await self.achat(query, employee_id, user_id)
 
 advanced_rag = AdvancedRAG()
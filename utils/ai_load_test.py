@@ -0,0 +1,309 @@
+"""Load test: menu callback latency while AI chats wait on the LLM.
+
+    python -m utils.ai_load_test [--chats 16] [--llm-seconds 3] [--callbacks 100] [--rate 50]
+
+Runs the Application from bot.py on a scratch SQLite database against two
+local stubs: a Telegram Bot API server and an OpenAI-style completion server
+(via GROQ_BASE_URL) that takes --llm-seconds per answer. Menu callbacks are
+timed from the moment they are queued until their handler has finished,
+first with no AI traffic and then while --chats AI conversations are waiting
+on the stub LLM. Exits 1 when the loaded p99 is more than --max-slowdown-ms
+above the idle p99.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+CALLBACKS = ('main_menu', 'payroll', 'attendance', 'leave', 'gamification', 'about')
+ANSWER = "Cuti tahunan diajukan melalui menu Cuti paling lambat tiga hari kerja sebelumnya."
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+MENU_USER_BASE = 1_000
+AI_USER_BASE = 2_000
+
+
+class StubServer:
+    """HTTP/1.1 server on its own thread and event loop, one request per connection,
+    so the stubs do not compete with the bot for its event loop."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.port = None
+        self.requests = 0
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            server = self.loop.run_until_complete(asyncio.start_server(self.serve, '127.0.0.1', 0))
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def serve(self, reader, writer):
+        try:
+            _, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while line := (await reader.readline()).decode('latin-1').strip():
+                name, _, value = line.partition(':')
+                headers[name.lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            self.requests += 1
+            await self.respond(path, body, writer)
+            await writer.drain()
+        except Exception as e:
+            logging.getLogger(__name__).debug(f"Stub request failed: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    def send_json(writer, payload: dict):
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+
+    async def respond(self, path: str, body: bytes, writer):
+        raise NotImplementedError
+
+
+class StubTelegram(StubServer):
+    """Answers every Bot API method with a plausible result."""
+
+    async def respond(self, path, body, writer):
+        method = path.rsplit('/', 1)[-1]
+        if method == 'getMe':
+            result = BOT_USER
+        elif method in ('sendMessage', 'editMessageText'):
+            result = {'message_id': 1, 'date': int(time.time()), 'chat': {'id': 1, 'type': 'private'}, 'text': 'ok'}
+        else:
+            result = True
+        self.send_json(writer, {'ok': True, 'result': result})
+
+
+class StubLLM(StubServer):
+    """Chat completions (plain or streamed) that take `seconds` to finish."""
+
+    def __init__(self, seconds: float):
+        super().__init__()
+        self.seconds = seconds
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+
+    async def respond(self, path, body, writer):
+        request = json.loads(body or b'{}')
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        base = {'id': 'stub', 'created': int(time.time()), 'model': request.get('model', 'stub')}
+        try:
+            if request.get('stream'):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n")
+                words = ANSWER.split(' ')
+                for i, word in enumerate(words):
+                    await asyncio.sleep(self.seconds / len(words))
+                    chunk = {**base, 'object': 'chat.completion.chunk', 'choices': [{
+                        'index': 0, 'delta': {'content': word if i == 0 else f" {word}"}, 'finish_reason': None
+                    }]}
+                    writer.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    await writer.drain()
+                writer.write(b"data: [DONE]\n\n")
+            else:
+                await asyncio.sleep(self.seconds)
+                self.send_json(writer, {**base, 'object': 'chat.completion', 'choices': [{
+                    'index': 0, 'message': {'role': 'assistant', 'content': ANSWER}, 'finish_reason': 'stop'
+                }], 'usage': {'prompt_tokens': 100, 'completion_tokens': 20, 'total_tokens': 120}})
+            self.completed += 1
+        finally:
+            self.in_flight -= 1
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"User {user_id}"}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private', 'first_name': user['first_name']},
+                'from': BOT_USER,
+                'text': 'menu',
+            },
+        },
+    }
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def seed_employees(count: int):
+    from models import init_db, SessionLocal, Employee
+    from datetime import datetime
+
+    init_db()
+    with SessionLocal() as db:
+        db.add_all([
+            Employee(telegram_user_id=user_id, nik=f"LOAD{user_id:06d}", nama=f"Karyawan {user_id}",
+                     jabatan='Staff', departemen='HR', tanggal_bergabung=datetime(2020, 1, 1))
+            for base in (MENU_USER_BASE, AI_USER_BASE) for user_id in range(base, base + count)
+        ])
+        db.commit()
+
+
+async def run(args, telegram: StubTelegram, llm: StubLLM) -> dict:
+    import bot
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from utils.webhook import fake_update
+
+    app = bot.build_application(base_url=f"http://127.0.0.1:{telegram.port}/bot")
+    update_ids = itertools.count(1)
+    queued, done = {}, {}
+
+    async def finished(update: Update, context):
+        # Group 1 runs once the group 0 handler has returned
+        done[update.update_id] = time.perf_counter()
+
+    app.add_handler(TypeHandler(Update, finished), group=1)
+
+    async def put(payload: dict) -> int:
+        update = Update.de_json(payload, app.bot)
+        queued[update.update_id] = time.perf_counter()
+        await app.update_queue.put(update)
+        return update.update_id
+
+    async def settle(ids: list, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while any(i not in done for i in ids) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def menu_callbacks() -> list:
+        ids = []
+        for i in range(args.callbacks):
+            ids.append(await put(callback_update(
+                next(update_ids), MENU_USER_BASE + i % args.users, CALLBACKS[i % len(CALLBACKS)]
+            )))
+            await asyncio.sleep(1 / args.rate)
+        await settle(ids)
+        return [(done[i] - queued[i]) * 1000 for i in ids if i in done]
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    try:
+        if not await bot.advanced_rag.wait_ready():
+            raise RuntimeError("AI initialisation did not finish")
+        # Warm-up: fills the employee and dashboard caches, puts the AI users in AI mode
+        warm_up = [await put(callback_update(next(update_ids), MENU_USER_BASE + i, 'main_menu'))
+                   for i in range(args.users)]
+        warm_up += [await put(callback_update(next(update_ids), AI_USER_BASE + i, 'ai_mode'))
+                    for i in range(args.chats)]
+        await settle(warm_up)
+
+        idle = await menu_callbacks()
+
+        chats_started = time.perf_counter()
+        for i in range(args.chats):
+            await put(fake_update(next(update_ids), AI_USER_BASE + i, f"Bagaimana cara mengajukan cuti? ({i})"))
+        while llm.in_flight == 0 and time.perf_counter() - chats_started < 10:
+            await asyncio.sleep(0.01)
+        in_flight_at_start = llm.in_flight
+        loaded = await menu_callbacks()
+
+        deadline = time.monotonic() + args.chats * args.llm_seconds + 30
+        while llm.completed < args.chats and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        chats_seconds = time.perf_counter() - chats_started
+    finally:
+        await app.stop()
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+    return {
+        'idle': idle,
+        'loaded': loaded,
+        'in_flight_at_start': in_flight_at_start,
+        'peak_in_flight': llm.peak_in_flight,
+        'answered': llm.completed,
+        'chats_seconds': chats_seconds,
+        'telegram_requests': telegram.requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=16, help='AI conversations started at once')
+    parser.add_argument('--llm-seconds', type=float, default=3, help='stub LLM time per answer')
+    parser.add_argument('--callbacks', type=int, default=100, help='menu callbacks per phase')
+    parser.add_argument('--rate', type=float, default=50, help='menu callbacks per second')
+    parser.add_argument('--users', type=int, default=20, help='distinct menu users')
+    parser.add_argument('--max-slowdown-ms', type=float, default=100)
+    args = parser.parse_args()
+
+    # Everything below runs on scratch state; set before config.settings is imported
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'ai_load_test.db')}"
+    os.environ['METRICS_PORT'] = '0'
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:load-test')
+    os.environ.setdefault('GROQ_API_KEY', 'load-test')
+    telegram = StubTelegram().start()
+    llm = StubLLM(args.llm_seconds).start()
+    os.environ['GROQ_BASE_URL'] = f"http://127.0.0.1:{llm.port}"
+
+    logging.basicConfig(level=logging.WARNING)
+    seed_employees(max(args.users, args.chats))
+    try:
+        r = asyncio.run(run(args, telegram, llm))
+    finally:
+        telegram.stop()
+        llm.stop()
+
+    idle_p99, loaded_p99 = percentile(r['idle'], 0.99), percentile(r['loaded'], 0.99)
+    failed = (
+        len(r['loaded']) < args.callbacks
+        or not r['in_flight_at_start']
+        or loaded_p99 - idle_p99 > args.max_slowdown_ms
+    )
+    print(f"{args.callbacks} menu callbacks at {args.rate:g}/s, {args.chats} AI chats, stub LLM {args.llm_seconds:g}s per answer")
+    for name in ('idle', 'loaded'):
+        latencies = r[name]
+        print(
+            f"  {name:<6} done {len(latencies):>4}  p50 {percentile(latencies, 0.5):7.1f} ms  "
+            f"p99 {percentile(latencies, 0.99):7.1f} ms  max {max(latencies, default=0):7.1f} ms"
+        )
+    print(
+        f"  LLM requests in flight when callbacks started {r['in_flight_at_start']}, peak {r['peak_in_flight']}; "
+        f"{r['answered']}/{args.chats} chats answered in {r['chats_seconds']:.1f}s"
+    )
+    print(
+        f"{'FAIL' if failed else 'OK'} callback p99 {idle_p99:.1f} ms idle -> {loaded_p99:.1f} ms "
+        f"with AI chats in flight (limit +{args.max_slowdown_ms:g} ms)"
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 from groq import Groq
 from config.settings import GROQ_API_KEY
 from models import SessionLocal, KnowledgeBase
+from utils.answer_cache import AnswerCache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,37 +14,47 @@ class AIService:
         try:
             self.client = Groq(api_key=GROQ_API_KEY)
             self.model = "llama-3.1-8b-instant"
+            self.answer_cache = AnswerCache('ai_service_answer')
             logger.info(f"AI Service initialized with {self.model}")
         except Exception as e:
             logger.error(f"Failed to initialize AI Service: {e}")
             self.client = None
     
-    def get_context_from_kb(self, query: str) -> str:
-        """Get relevant context from knowledge base."""
+    def get_relevant_entries(self, query: str) -> list:
+        """KB entries whose tags appear in the query (max 2)."""
         db = SessionLocal()
         try:
             kb_entries = db.query(KnowledgeBase).all()
-            
-            relevant = []
             query_lower = query.lower()
             
-            for entry in kb_entries:
-                if entry.tags and any(keyword in query_lower for keyword in entry.tags.split(',')):
-                    relevant.append(f"{entry.judul}:\n{entry.konten}")
-            
-            if relevant:
-                return "\n\n".join(relevant[:2])
-            return ""
+            relevant = [
+                entry for entry in kb_entries
+                if entry.tags and any(keyword in query_lower for keyword in entry.tags.split(','))
+            ]
+            return relevant[:2]
         finally:
             db.close()
     
+    def get_context_from_kb(self, query: str, entries: list = None) -> str:
+        """Get relevant context from knowledge base."""
+        if entries is None:
+            entries = self.get_relevant_entries(query)
+        return "\n\n".join(f"{entry.judul}:\n{entry.konten}" for entry in entries)
+    
     def chat(self, user_message: str, employee_name: str = None) -> str:
         """Chat with AI assistant."""
         if not self.client:
             return "Maaf, AI Assistant sedang tidak tersedia."
         
         try:
-            context = self.get_context_from_kb(user_message)
+            entries = self.get_relevant_entries(user_message)
+            
+            # Prompt has no employee data, so answers are shared
+            cached = self.answer_cache.get(user_message, entries)
+            if cached is not None:
+                return cached
+            
+            context = self.get_context_from_kb(user_message, entries)
             
             system_prompt = """Kamu adalah asisten HR untuk BPKH (Badan Pengelola Keuangan Haji), lembaga pemerintah Indonesia yang mengelola dana haji.
 
@@ -73,7 +84,9 @@ PENTING:
                 max_tokens=200  # Limit supaya jawaban lebih pendek
             )
             
-            return response.choices[0].message.content
+            answer = response.choices[0].message.content
+            self.answer_cache.set(user_message, entries, answer)
+            return answer
             
         except Exception as e:
             logger.error(f"AI chat error: {e}")
@@ -0,0 +1,118 @@
+"""Cache of LLM answers for repeated HR questions."""
+from models import KnowledgeBase
+from utils.cache import TTLCache
+from utils.text import tokenize
+from utils.vector_index import dense_index
+from sqlalchemy import event
+from config.settings import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAX_VARIANTS = 32
+
+_caches = []
+
+
+class AnswerCache:
+    """Answers keyed on (normalised query, KB context, scope).
+
+    The KB context is the retrieved passages as (knowledge_base_id, id,
+    updated_at), so an edited entry can never serve an answer built from
+    its old text. `scope` names whose data the prompt carried (see
+    AdvancedRAG.build_messages); only prompts with no personal data at all
+    share scope None. With ANSWER_CACHE_SIMILARITY > 0, a query that
+    misses exactly is matched against earlier phrasings that retrieved the
+    same entries, by embedding cosine similarity. Those phrasings are kept
+    per (KB context, scope) under the same size bound and TTL as the answers.
+    """
+
+    def __init__(self, name: str = 'answer', maxsize: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 similarity: float = ANSWER_CACHE_SIMILARITY, encoder=dense_index):
+        self.cache = TTLCache(name, maxsize=maxsize, ttl=ttl, log_every=200)
+        self.similarity = similarity
+        self.encoder = encoder
+        self.near_hits = 0
+        # (kb_key, scope) -> {normalised query: vector}
+        self.variants = TTLCache(f"{name}_variants", maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        _caches.append(self)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return ' '.join(tokenize(query))
+
+    @staticmethod
+    def kb_key(kb_entries: list) -> tuple:
+        return tuple(sorted(
+            (getattr(entry, 'knowledge_base_id', entry.id), entry.id, entry.updated_at)
+            for entry in kb_entries
+        ))
+
+    def _use_similarity(self) -> bool:
+        return self.similarity > 0 and self.encoder.load_model()
+
+    def get(self, query: str, kb_entries: list, scope=None):
+        """Cached answer or None."""
+        normalized = self.normalize(query)
+        kb_key = self.kb_key(kb_entries)
+
+        answer = self.cache.get((normalized, kb_key, scope))
+        if answer is not None or not self._use_similarity():
+            return answer
+
+        with self._lock:
+            variants = list(self.variants.get((kb_key, scope), {}).items())
+        if not variants:
+            return None
+
+        vector = self.encoder.embed([normalized])[0]
+        best, best_score = None, self.similarity
+        for variant, variant_vector in variants:
+            score = float(variant_vector @ vector)
+            if score >= best_score:
+                best, best_score = variant, score
+        if best is None:
+            return None
+
+        answer = self.cache.get((best, kb_key, scope))
+        if answer is None:
+            with self._lock:
+                self.variants.get((kb_key, scope), {}).pop(best, None)
+        else:
+            self.near_hits += 1
+            logger.debug(f"Answer cache near hit: {query!r} ~ {best!r} ({best_score:.3f})")
+        return answer
+
+    def set(self, query: str, kb_entries: list, answer: str, scope=None):
+        normalized = self.normalize(query)
+        kb_key = self.kb_key(kb_entries)
+        self.cache.set((normalized, kb_key, scope), answer)
+
+        if self._use_similarity():
+            vector = self.encoder.embed([normalized])[0]
+            with self._lock:
+                variants = self.variants.get((kb_key, scope)) or {}
+                variants[normalized] = vector
+                while len(variants) > MAX_VARIANTS:
+                    variants.pop(next(iter(variants)))
+                self.variants.set((kb_key, scope), variants)
+
+    def invalidate_entry(self, entry_id: int):
+        """Drop every answer that was built from KB entry `entry_id`."""
+        self.cache.invalidate_where(lambda key: any(item[0] == entry_id for item in key[1]))
+        self.variants.invalidate_where(lambda key: any(item[0] == entry_id for item in key[0]))
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), 'near_hits': self.near_hits}
+
+
+answer_cache = AnswerCache()
+
+
+@event.listens_for(KnowledgeBase, 'after_update')
+@event.listens_for(KnowledgeBase, 'after_delete')
+def _invalidate_answers(mapper, connection, target):
+    for cache in _caches:
+        cache.invalidate_entry(target.id)
@@ -0,0 +1,319 @@
+"""Incrementally maintained attendance summaries (tabel attendance_stats).
+
+Clock-in/clock-out update one AttendanceStats row per employee, so the menu,
+analytics and leaderboard screens read a single row instead of scanning
+30-90 Absensi rows. Run `python -m utils.attendance_stats` after bulk
+imports or manual Absensi edits to rebuild the table.
+
+    python -m utils.attendance_stats --benchmark [--employees 5000] [--days 90] [--max-ms 100]
+
+seeds a scratch SQLite database with --employees x --days Absensi rows and
+times the leaderboard (EnterpriseFeatures.calculate_leaderboard in bot.py),
+once with every summary current and once the morning after, when no one
+has clocked in yet and every row has to be slid forward a day.
+"""
+from models import SessionLocal, Employee, Absensi, AttendanceStats
+from sqlalchemy import select
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+WINDOW_DAYS = 90
+EMPTY = '.'
+HADIR = 'Hh'
+ON_TIME = 'HO'
+
+# Runs of hadir slots; EMPTY slots are removed first so they never break a streak
+NOT_HADIR_RE = re.compile(f"[^{HADIR}]+")
+
+FIELDS_30 = ('total_30', 'hadir_30', 'on_time_30', 'current_streak', 'max_streak_30', 'streak_bonus_30')
+
+
+def day_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+def encode_day(absensi) -> str:
+    """One slot per Absensi row: H/h hadir (on time/late), O/x other status."""
+    on_time = bool(absensi.waktu_masuk and absensi.waktu_masuk.hour <= 8)
+    if absensi.status == 'hadir':
+        return 'H' if on_time else 'h'
+    return 'O' if on_time else 'x'
+
+
+def summarize_30(days: str) -> dict:
+    """Gamification counters over the last 30 slots.
+
+    String operations rather than a loop per slot: the leaderboard runs this
+    for every employee whose summary is behind (each morning, all of them).
+    A streak earns 10 points for every hadir day from its 7th on.
+    """
+    window = days[-30:].replace(EMPTY, '')
+    hadir = window.count('H') + window.count('h')
+    streaks = [hadir] if hadir == len(window) else [len(run) for run in NOT_HADIR_RE.split(window)]
+    return {
+        'total_30': len(window),
+        'hadir_30': hadir,
+        'on_time_30': window.count('H') + window.count('O'),
+        'current_streak': streaks[-1],
+        'max_streak_30': max(streaks),
+        'streak_bonus_30': sum(10 * (streak - 6) for streak in streaks if streak > 6)
+    }
+
+
+def summarize(days: str, hours: list) -> dict:
+    """All derived counters for a 90-slot window."""
+    summary = summarize_30(days)
+    summary.update({
+        'total_90': WINDOW_DAYS - days.count(EMPTY),
+        'hadir_90': days.count('H') + days.count('h'),
+        'on_time_90': days.count('H') + days.count('O'),
+        'total_hours_90': round(sum(hours), 2)
+    })
+    return summary
+
+
+def parse_hours(stats) -> list:
+    if not stats.hours:
+        return [0.0] * WINDOW_DAYS
+    return [float(h) for h in stats.hours.split(',')]
+
+
+def shifted_days(stats, today: datetime) -> str:
+    """`days` slid forward so the window ends at `today`."""
+    days = stats.days or EMPTY * WINDOW_DAYS
+    gap = (today - stats.as_of).days if stats.as_of else WINDOW_DAYS
+    if gap <= 0:
+        return days
+    return (days + EMPTY * min(gap, WINDOW_DAYS))[-WINDOW_DAYS:]
+
+
+def shift(stats, today: datetime) -> tuple:
+    gap = (today - stats.as_of).days if stats.as_of else WINDOW_DAYS
+    hours = parse_hours(stats)
+    if gap > 0:
+        hours = (hours + [0.0] * min(gap, WINDOW_DAYS))[-WINDOW_DAYS:]
+    return list(shifted_days(stats, today)), hours
+
+
+def store(stats, days: list, hours: list, today: datetime):
+    days = ''.join(days)
+    stats.as_of = today
+    stats.days = days
+    stats.hours = ','.join(f"{h:g}" for h in hours)
+    for field, value in summarize(days, hours).items():
+        setattr(stats, field, value)
+
+
+def load_windows(db, employee_ids=None, today: datetime = None) -> dict:
+    """Build {employee_id: (days, hours)} from raw Absensi rows in one query."""
+    today = today or day_start(datetime.now())
+    first_day = today - timedelta(days=WINDOW_DAYS - 1)
+
+    query = db.query(Absensi).filter(Absensi.tanggal >= first_day).order_by(Absensi.tanggal, Absensi.id)
+    if employee_ids is not None:
+        query = query.filter(Absensi.employee_id.in_(employee_ids))
+
+    windows = {}
+    for absensi in query:
+        days, hours = windows.setdefault(
+            absensi.employee_id, ([EMPTY] * WINDOW_DAYS, [0.0] * WINDOW_DAYS)
+        )
+        slot = WINDOW_DAYS - 1 - (today - day_start(absensi.tanggal)).days
+        if 0 <= slot < WINDOW_DAYS:
+            days[slot] = encode_day(absensi)
+            hours[slot] = absensi.jam_kerja or 0.0
+    return windows
+
+
+def rebuild_attendance_stats(db, employee_ids=None) -> list:
+    """Recompute AttendanceStats rows from Absensi (caller commits)."""
+    today = day_start(datetime.now())
+    if employee_ids is None:
+        employee_ids = [row[0] for row in db.query(Employee.id).all()]
+
+    windows = load_windows(db, employee_ids, today)
+    existing = {
+        stats.employee_id: stats
+        for stats in db.query(AttendanceStats).filter(AttendanceStats.employee_id.in_(employee_ids))
+    }
+
+    rebuilt = []
+    for employee_id in employee_ids:
+        stats = existing.get(employee_id)
+        if stats is None:
+            stats = AttendanceStats(employee_id=employee_id)
+            db.add(stats)
+        days, hours = windows.get(employee_id, ([EMPTY] * WINDOW_DAYS, [0.0] * WINDOW_DAYS))
+        store(stats, days, hours, today)
+        rebuilt.append(stats)
+
+    return rebuilt
+
+
+def record_attendance(db, absensi):
+    """Fold one new/changed Absensi row into its summary (caller commits)."""
+    today = day_start(datetime.now())
+    stats = db.get(AttendanceStats, absensi.employee_id)
+    if stats is None:
+        stats = rebuild_attendance_stats(db, [absensi.employee_id])[0]
+
+    days, hours = shift(stats, today)
+    slot = WINDOW_DAYS - 1 - (today - day_start(absensi.tanggal)).days
+    if 0 <= slot < WINDOW_DAYS:
+        days[slot] = encode_day(absensi)
+        hours[slot] = absensi.jam_kerja or 0.0
+    store(stats, days, hours, today)
+    return stats
+
+
+def get_attendance_stats(db, employee_id: int) -> dict:
+    """Current summary for one employee, read from a single row."""
+    today = day_start(datetime.now())
+    stats = db.get(AttendanceStats, employee_id)
+    if stats is None:
+        days, hours = load_windows(db, [employee_id], today).get(
+            employee_id, ([EMPTY] * WINDOW_DAYS, [0.0] * WINDOW_DAYS)
+        )
+        return summarize(''.join(days), hours)
+
+    if stats.as_of == today:
+        return {column: getattr(stats, column) for column in FIELDS_30 + ('total_90', 'hadir_90', 'on_time_90', 'total_hours_90')}
+
+    days, hours = shift(stats, today)
+    return summarize(''.join(days), hours)
+
+
+def get_all_gamification_stats(db) -> dict:
+    """{employee_id: 30-day counters} for every employee (leaderboard)."""
+    today = day_start(datetime.now())
+    columns = [getattr(AttendanceStats, field) for field in FIELDS_30]
+
+    result = {}
+    rows = db.execute(select(AttendanceStats.employee_id, AttendanceStats.as_of, AttendanceStats.days, *columns))
+    for employee_id, as_of, days, *counters in rows.tuples():
+        if as_of == today:
+            result[employee_id] = dict(zip(FIELDS_30, counters))
+        else:
+            gap = (today - as_of).days if as_of else WINDOW_DAYS
+            result[employee_id] = summarize_30((days or '') + EMPTY * min(gap, 30))
+
+    missing = [row[0] for row in db.query(Employee.id).filter(Employee.id.notin_(db.query(AttendanceStats.employee_id)))]
+    if missing:
+        for employee_id, (days, hours) in load_windows(db, missing, today).items():
+            result[employee_id] = summarize_30(''.join(days))
+
+    return result
+
+
+def seed_benchmark(db, employees: int, days: int, today: datetime):
+    """Employees 1..`employees` with ~90% attendance over the last `days` days, plus their summaries."""
+    from sqlalchemy import insert
+
+    rng = random.Random(0)
+    db.execute(insert(Employee), [
+        {'id': i, 'telegram_user_id': i, 'nik': f"BENCH{i:06d}", 'nama': f"Karyawan {i}"}
+        for i in range(1, employees + 1)
+    ])
+    rows = []
+    for employee_id in range(1, employees + 1):
+        for offset in range(days):
+            if rng.random() < 0.1:
+                continue
+            tanggal = today - timedelta(days=offset)
+            masuk = tanggal + timedelta(hours=7, minutes=rng.randint(0, 120))
+            rows.append({'employee_id': employee_id, 'tanggal': tanggal, 'waktu_masuk': masuk,
+                         'waktu_keluar': masuk + timedelta(hours=8), 'status': 'hadir', 'jam_kerja': 8.0})
+        if len(rows) >= 50_000:
+            db.execute(insert(Absensi), rows)
+            rows = []
+    if rows:
+        db.execute(insert(Absensi), rows)
+    rebuild_attendance_stats(db)
+    db.commit()
+
+
+async def time_leaderboard(session_factory, runs: int) -> list:
+    # The screen itself lives in bot.py; imported here so only --benchmark pays for it
+    from bot import EnterpriseFeatures
+
+    timings = []
+    async with session_factory() as db:
+        for _ in range(runs):
+            start = time.perf_counter()
+            await EnterpriseFeatures.calculate_leaderboard(db, limit=10)
+            timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)
+
+
+def benchmark(employees: int, days: int, runs: int) -> dict:
+    from sqlalchemy import create_engine, update
+    from sqlalchemy.orm import Session
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from models import Base
+
+    path = os.path.join(tempfile.mkdtemp(), 'attendance_bench.db')
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    today = day_start(datetime.now())
+    start = time.perf_counter()
+    with Session(engine) as db:
+        seed_benchmark(db, employees, days, today)
+        rows = db.query(Absensi).count()
+    seconds = time.perf_counter() - start
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+    result = {'rows': rows, 'seed_seconds': seconds}
+    try:
+        result['current'] = asyncio.run(time_leaderboard(session_factory, runs))
+        with Session(engine) as db:
+            # The morning after: every summary is one day behind
+            db.execute(update(AttendanceStats).values(as_of=today - timedelta(days=1)))
+            db.commit()
+        result['morning'] = asyncio.run(time_leaderboard(session_factory, runs))
+    finally:
+        asyncio.run(async_engine.dispose())
+        engine.dispose()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employee', type=int, action='append', help="only rebuild these employee ids")
+    parser.add_argument('--benchmark', action='store_true', help="time the leaderboard on a scratch database")
+    parser.add_argument('--employees', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--max-ms', type=float, default=100, help="p50 leaderboard target")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        r = benchmark(args.employees, args.days, args.runs)
+        print(f"{args.employees} employees x {args.days} days ({r['rows']} absensi rows, seeded in {r['seed_seconds']:.1f}s)")
+        failed = False
+        for name in ('current', 'morning'):
+            timings = r[name]
+            p50 = timings[len(timings) // 2]
+            failed = failed or p50 > args.max_ms
+            print(f"  {name:<8} leaderboard p50 {p50:7.1f} ms  max {timings[-1]:7.1f} ms  ({len(timings)} runs)")
+        print(f"{'FAIL' if failed else 'OK'} leaderboard p50 within {args.max_ms:g} ms")
+        sys.exit(1 if failed else 0)
+
+    db = SessionLocal()
+    try:
+        rebuilt = rebuild_attendance_stats(db, args.employee)
+        db.commit()
+        print(f"OK {len(rebuilt)} ringkasan absensi berhasil dibangun ulang!")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""Splits KnowledgeBase entries into overlapping chunks for retrieval.
+
+`chunk_sync.sync()` keeps the knowledge_chunks table in step with
+knowledge_base: entries whose `updated_at` differs from their chunks'
+`source_updated_at` are re-chunked, chunks of deleted entries are dropped.
+Chunks never span paragraphs and existing rows are matched by content
+hash, so editing one paragraph only re-embeds the chunks of that paragraph
+(and the overlap at the start of the next), wherever the rest moved.
+The KB indexes call it before every refresh. Run `python -m utils.chunking`
+to rebuild from the command line.
+"""
+from models import SessionLocal, KnowledgeBase, KnowledgeChunk
+from sqlalchemy import event, func, select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer
+from config.settings import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, KB_INDEX_REFRESH_SECONDS
+from utils.text import estimate_tokens
+from datetime import datetime
+import argparse
+import hashlib
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PARAGRAPH_RE = re.compile(r'\n\s*\n')
+SENTENCE_RE = re.compile(r'(?<=[.!?;:])\s+|\n+')
+
+
+def split_units(text: str, max_tokens: int) -> list:
+    """Sentences (paragraph-aware); sentences over `max_tokens` are cut on word boundaries."""
+    units = []
+    for paragraph in PARAGRAPH_RE.split(text):
+        for sentence in SENTENCE_RE.split(paragraph):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if estimate_tokens(sentence) <= max_tokens:
+                units.append(sentence)
+                continue
+
+            words, current = sentence.split(), []
+            for word in words:
+                if current and estimate_tokens(' '.join(current + [word])) > max_tokens:
+                    units.append(' '.join(current))
+                    current = []
+                current.append(word)
+            if current:
+                units.append(' '.join(current))
+    return units
+
+
+def split_sections(text: str, min_tokens: int) -> list:
+    """Paragraphs; those under `min_tokens` (headings, labels) are joined to the next."""
+    sections, pending = [], []
+    for paragraph in PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pending.append(paragraph)
+        if estimate_tokens(paragraph) >= min_tokens:
+            sections.append('\n\n'.join(pending))
+            pending = []
+    if pending:
+        if sections:
+            sections[-1] = '\n\n'.join([sections[-1], *pending])
+        else:
+            sections.append('\n\n'.join(pending))
+    return sections
+
+
+def overlap_tail(units: list, overlap: int, room: int) -> list:
+    """Trailing `units` worth at most `overlap` tokens (and `room`)."""
+    tail, size = [], 0
+    for unit in reversed(units):
+        cost = estimate_tokens(unit) + 1
+        if size + cost > overlap or size + cost > room:
+            break
+        tail.insert(0, unit)
+        size += cost
+    return tail
+
+
+def split_text(text: str, max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS) -> list:
+    """Pack sentences into chunks of <= max_tokens; each chunk repeats up to
+    `overlap` tokens of trailing sentences from the previous one.
+
+    A chunk never spans two paragraphs, so a paragraph that grows or shrinks
+    does not move the boundaries of the chunks after it.
+    """
+    if not text or not text.strip():
+        return []
+    if estimate_tokens(text) <= max_tokens:
+        return [text.strip()]
+
+    chunks, previous = [], []
+    for section in split_sections(text, overlap):
+        current, size = [], 0
+        for unit in split_units(section, max_tokens):
+            cost = estimate_tokens(unit) + 1
+            if current and size + cost > max_tokens:
+                chunks.append(' '.join(current))
+                previous, current = current, []
+            if not current:
+                current = overlap_tail(previous, overlap, max_tokens - cost)
+                size = sum(estimate_tokens(carried) + 1 for carried in current)
+            current.append(unit)
+            size += cost
+        chunks.append(' '.join(current))
+        previous = current
+    return chunks
+
+
+def chunk_ids(parent_id, digests: list) -> list:
+    """Ids derived from each chunk's content hash; a passage repeated within
+    one parent gets a -2, -3, ... suffix."""
+    seen, ids = {}, []
+    for digest in digests:
+        seen[digest] = seen.get(digest, 0) + 1
+        ids.append(f"{parent_id}-{digest[:16]}" + (f"-{seen[digest]}" if seen[digest] > 1 else ""))
+    return ids
+
+
+def content_hash(judul: str, konten: str, tags: str) -> str:
+    return hashlib.sha1(f"{judul}\x00{konten}\x00{tags}".encode('utf-8')).hexdigest()
+
+
+def chunk_entry(entry) -> list:
+    """[(ordinal, text), ...]; an entry without text still gets one chunk."""
+    return list(enumerate(split_text(entry.konten or '') or [entry.konten or '']))
+
+
+def rechunk(db, entries: list) -> tuple:
+    """Upsert the chunks of `entries`; returns (written, deleted).
+
+    Existing chunks are matched by content hash rather than position, so a
+    passage that only moved keeps its row, id and stored embedding.
+    """
+    ids = [entry.id for entry in entries]
+    existing, reusable = {}, {}
+    for chunk in db.query(KnowledgeChunk).options(defer(KnowledgeChunk.embedding)).filter(
+        KnowledgeChunk.knowledge_base_id.in_(ids)
+    ).order_by(KnowledgeChunk.ordinal):
+        existing[chunk.id] = chunk
+        reusable.setdefault((chunk.knowledge_base_id, chunk.content_hash), []).append(chunk)
+
+    now = datetime.now()
+    written, keep = 0, set()
+    for entry in entries:
+        pieces = chunk_entry(entry)
+        digests = [content_hash(entry.judul, text, entry.tags) for _, text in pieces]
+        for (ordinal, text), digest, cid in zip(pieces, digests, chunk_ids(entry.id, digests)):
+            matches = reusable.get((entry.id, digest))
+            if matches:
+                chunk = matches.pop(0)
+                chunk.ordinal = ordinal
+                chunk.source_updated_at = entry.updated_at
+                keep.add(chunk.id)
+                continue
+
+            chunk = KnowledgeChunk(
+                id=cid, knowledge_base_id=entry.id, ordinal=ordinal, judul=entry.judul, konten=text,
+                tags=entry.tags, content_hash=digest, source_updated_at=entry.updated_at, updated_at=now
+            )
+            db.add(chunk)
+            keep.add(cid)
+            written += 1
+
+    stale = [cid for cid in existing if cid not in keep]
+    if stale:
+        db.execute(delete(KnowledgeChunk).where(KnowledgeChunk.id.in_(stale)))
+    return written, len(stale)
+
+
+class ChunkSync:
+    """Throttled reconciliation of knowledge_chunks against knowledge_base."""
+
+    def __init__(self, refresh_interval: float = KB_INDEX_REFRESH_SECONDS):
+        self.refresh_interval = refresh_interval
+        self._stale = True
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def mark_stale(self):
+        self._stale = True
+
+    def sync(self, force: bool = False) -> tuple:
+        """Returns (entries rechunked, chunks written, chunks deleted)."""
+        now = time.monotonic()
+        if not force and not self._stale and now - self._last_check < self.refresh_interval:
+            return 0, 0, 0
+
+        with self._lock:
+            if not force and not self._stale and now - self._last_check < self.refresh_interval:
+                return 0, 0, 0
+            self._last_check = now
+            self._stale = False
+
+            db = SessionLocal()
+            try:
+                sources = dict(db.execute(select(KnowledgeBase.id, KnowledgeBase.updated_at)).all())
+                chunked = dict(db.execute(
+                    select(KnowledgeChunk.knowledge_base_id, func.max(KnowledgeChunk.source_updated_at))
+                    .group_by(KnowledgeChunk.knowledge_base_id)
+                ).all())
+
+                changed = [kb_id for kb_id, updated_at in sources.items() if chunked.get(kb_id, False) != updated_at]
+                orphaned = [kb_id for kb_id in chunked if kb_id not in sources]
+                if not changed and not orphaned:
+                    return 0, 0, 0
+
+                written, deleted = 0, 0
+                for start in range(0, len(changed), 500):
+                    batch = db.query(KnowledgeBase).filter(KnowledgeBase.id.in_(changed[start:start + 500])).all()
+                    batch_written, batch_deleted = rechunk(db, batch)
+                    written += batch_written
+                    deleted += batch_deleted
+                if orphaned:
+                    deleted += db.execute(
+                        delete(KnowledgeChunk).where(KnowledgeChunk.knowledge_base_id.in_(orphaned))
+                    ).rowcount
+                db.commit()
+
+                logger.info(f"KB chunks synced: {len(changed)} entries, {written} chunks written, {deleted} deleted")
+                return len(changed), written, deleted
+            except IntegrityError as e:
+                # Another worker chunked the same entries first
+                db.rollback()
+                self._stale = True
+                logger.warning(f"KB chunk sync conflict, retrying later: {e}")
+                return 0, 0, 0
+            finally:
+                db.close()
+
+
+chunk_sync = ChunkSync()
+
+
+@event.listens_for(KnowledgeBase, 'after_insert')
+@event.listens_for(KnowledgeBase, 'after_update')
+@event.listens_for(KnowledgeBase, 'after_delete')
+def _mark_chunks_stale(mapper, connection, target):
+    chunk_sync.mark_stale()
+
+
+def main():
+    from models import init_db
+
+    parser = argparse.ArgumentParser(description='Rebuild knowledge base chunks')
+    parser.add_argument('--rebuild', action='store_true', help='drop all chunks first')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    init_db()
+    if args.rebuild:
+        db = SessionLocal()
+        try:
+            db.execute(delete(KnowledgeChunk))
+            db.commit()
+        finally:
+            db.close()
+
+    entries, written, deleted = chunk_sync.sync(force=True)
+    print(f"OK {entries} entries chunked: {written} chunks written, {deleted} deleted")
+
+
+if __name__ == '__main__':
+    main()
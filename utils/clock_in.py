@@ -0,0 +1,408 @@
+"""Group commit for clock-in writes.
+
+During the morning surge every employee clocks in within a few minutes. On
+SQLite each separate read + insert + commit queues for the single write lock,
+so `clock_in_batcher` collects the clock-ins that arrive within
+CLOCK_IN_BATCH_WINDOW and writes them in one transaction: one query for the
+existing Absensi rows, one for their AttendanceStats rows and one commit.
+Each caller still gets its own (waktu_masuk, clocked_in) result.
+
+Clock-in is an INSERT ... ON CONFLICT (employee_id, tanggal) DO UPDATE that
+only fills an empty waktu_masuk, and clock-out an UPDATE guarded by
+`waktu_keluar IS NULL`, so double taps and parallel bot replicas can never
+create a second row for the day or clock in/out twice.
+
+    python -m utils.clock_in [--clock-ins 2000] [--seconds 60] [--mode both]
+    python -m utils.clock_in --stress [--employees 50] [--attempts 8] [--replicas 4] [--workers 8]
+
+The first simulates the surge against a scratch SQLite database and reports
+p50/p99 latency for the batched path and the one-commit-per-request path;
+the second fires parallel clock-ins/outs from several engines and fails
+unless every employee ends up with exactly one row and one success each.
+"""
+from models import AsyncSessionLocal, Absensi, AttendanceStats
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from config.settings import CLOCK_IN_BATCH_WINDOW, CLOCK_IN_BATCH_SIZE, CONCURRENT_UPDATES
+from utils.attendance_stats import record_attendance, day_start
+from utils.query_metrics import label_background
+from datetime import datetime
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+
+UPSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def clock_in_statement(dialect: str):
+    """INSERT that, on an existing (employee_id, tanggal) row, only fills a missing waktu_masuk."""
+    table = Absensi.__table__
+    statement = UPSERTS[dialect](table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.employee_id, table.c.tanggal],
+        set_={'waktu_masuk': statement.excluded.waktu_masuk, 'status': statement.excluded.status},
+        where=table.c.waktu_masuk.is_(None)
+    )
+
+
+async def write_clock_ins(db, requests: list) -> list:
+    """Clock in every (employee_id, now) in `requests` (caller commits).
+
+    Returns (waktu_masuk, clocked_in) per request; clocked_in is False when
+    the employee already clocked in that day, here or in another session.
+    """
+    first = {}
+    for employee_id, now in requests:
+        first.setdefault((employee_id, day_start(now)), now)
+
+    await db.execute(clock_in_statement(db.bind.dialect.name), [
+        {'employee_id': employee_id, 'tanggal': today, 'waktu_masuk': now, 'status': 'hadir'}
+        for (employee_id, today), now in first.items()
+    ])
+
+    employee_ids = {employee_id for employee_id, _ in first}
+    rows = {
+        (absensi.employee_id, absensi.tanggal): absensi
+        for absensi in await db.scalars(select(Absensi).filter(
+            Absensi.employee_id.in_(employee_ids),
+            Absensi.tanggal.in_({today for _, today in first})
+        ).execution_options(populate_existing=True))
+    }
+    # Loaded into the identity map so record_attendance does not query per employee
+    (await db.scalars(select(AttendanceStats).filter(AttendanceStats.employee_id.in_(employee_ids)))).all()
+
+    results, written = [], []
+    for employee_id, now in requests:
+        key = (employee_id, day_start(now))
+        absensi = rows[key]
+        # Our value only survives the upsert if nobody had clocked in before
+        clocked_in = first.get(key) is now and absensi.waktu_masuk == now
+        if clocked_in:
+            written.append(absensi)
+            del first[key]
+        results.append((absensi.waktu_masuk, clocked_in))
+
+    if written:
+        await db.run_sync(lambda session: [record_attendance(session, absensi) for absensi in written])
+    return results
+
+
+async def clock_out(db, employee_id: int, now: datetime = None) -> tuple:
+    """(absensi, status) with status 'ok', 'not_clocked_in' or 'already' (caller commits).
+
+    The UPDATE only matches while waktu_keluar is empty, so of two parallel
+    clock-outs exactly one gets 'ok'.
+    """
+    now = now or datetime.now()
+    today = day_start(now)
+    result = await db.execute(
+        update(Absensi.__table__).where(
+            Absensi.employee_id == employee_id,
+            Absensi.tanggal == today,
+            Absensi.waktu_masuk.is_not(None),
+            Absensi.waktu_keluar.is_(None)
+        ).values(waktu_keluar=now)
+    )
+    absensi = await db.scalar(select(Absensi).filter(
+        Absensi.employee_id == employee_id,
+        Absensi.tanggal == today
+    ).execution_options(populate_existing=True))
+
+    if result.rowcount != 1:
+        return absensi, 'not_clocked_in' if not absensi or not absensi.waktu_masuk else 'already'
+
+    absensi.jam_kerja = round((now - absensi.waktu_masuk).total_seconds() / 3600, 2)
+    await db.run_sync(record_attendance, absensi)
+    return absensi, 'ok'
+
+
+class ClockInBatcher:
+    """Coalesces concurrent clock-ins into short batched transactions."""
+
+    def __init__(self, session_factory=AsyncSessionLocal, window: float = CLOCK_IN_BATCH_WINDOW,
+                 max_batch: int = CLOCK_IN_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self.max_batch_seen = 0
+        self.fallbacks = 0
+        self._queue = None
+        self._worker = None
+
+    async def clock_in(self, employee_id: int, now: datetime = None) -> tuple:
+        """(waktu_masuk, clocked_in) once the batch holding this request is committed."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((employee_id, now or datetime.now(), future))
+        return await future
+
+    async def _run(self):
+        label_background('clock_in_batcher')
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            # Requests arriving while we wait (or while the previous batch was committing) join this batch
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            batch, stop = [item], False
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stop:
+                return
+
+    async def _write(self, batch: list) -> list:
+        async with self.session_factory() as db:
+            results = await write_clock_ins(db, [(employee_id, now) for employee_id, now, _ in batch])
+            await db.commit()
+            return results
+
+    async def _flush(self, batch: list):
+        self.batches += 1
+        self.requests += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        try:
+            results = await self._write(batch)
+        except Exception as e:
+            # One bad row must not fail everyone else's clock-in
+            self.fallbacks += 1
+            logger.warning(f"Clock-in batch of {len(batch)} failed, retrying one by one: {e}")
+            for item in batch:
+                try:
+                    result = (await self._write([item]))[0]
+                except Exception as item_error:
+                    if not item[2].done():
+                        item[2].set_exception(item_error)
+                    continue
+                if not item[2].done():
+                    item[2].set_result(result)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """Write whatever is queued and stop the worker."""
+        if self._worker is not None and not self._worker.done():
+            self._queue.put_nowait(None)
+            await self._worker
+        self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'avg_batch': round(self.requests / self.batches, 1) if self.batches else 0,
+            'max_batch': self.max_batch_seen,
+            'fallbacks': self.fallbacks
+        }
+
+
+clock_in_batcher = ClockInBatcher()
+
+
+async def clock_in_direct(session_factory, employee_id: int, now: datetime = None) -> tuple:
+    """One transaction per clock-in, as the handler did before batching."""
+    async with session_factory() as db:
+        result = (await write_clock_ins(db, [(employee_id, now or datetime.now())]))[0]
+        await db.commit()
+        return result
+
+
+def scratch_engine(url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from sqlalchemy import event
+    from models.database import set_sqlite_pragmas, is_sqlite
+
+    engine = create_async_engine(url)
+    if is_sqlite(url):
+        event.listen(engine.sync_engine, 'connect', set_sqlite_pragmas)
+    return engine, async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+
+async def create_scratch_tables(engine, employees: int):
+    from sqlalchemy import insert
+    from models import Base, Employee
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Employee), [
+            {'id': i, 'telegram_user_id': i, 'nik': f"BENCH{i:06d}", 'nama': f"Karyawan {i}"}
+            for i in range(1, employees + 1)
+        ])
+
+
+async def benchmark(url: str, clock_ins: int, seconds: float, mode: str) -> dict:
+    engine, session_factory = scratch_engine(url)
+    await create_scratch_tables(engine, clock_ins)
+
+    results = {}
+    try:
+        for name in (['direct', 'batched'] if mode == 'both' else [mode]):
+            async with engine.begin() as conn:
+                await conn.execute(Absensi.__table__.delete())
+                await conn.execute(AttendanceStats.__table__.delete())
+
+            batcher = ClockInBatcher(session_factory)
+            rng = random.Random(42)
+            arrivals = sorted(rng.uniform(0, seconds) for _ in range(clock_ins))
+            latencies = []
+
+            async def one(employee_id: int, at: float, start: float):
+                await asyncio.sleep(max(start + at - time.perf_counter(), 0))
+                began = time.perf_counter()
+                if name == 'batched':
+                    await batcher.clock_in(employee_id)
+                else:
+                    await clock_in_direct(session_factory, employee_id)
+                latencies.append(time.perf_counter() - began)
+
+            start = time.perf_counter()
+            outcome = await asyncio.gather(
+                *(one(i + 1, at, start) for i, at in enumerate(arrivals)), return_exceptions=True
+            )
+            elapsed = time.perf_counter() - start
+            await batcher.close()
+
+            latencies.sort()
+            results[name] = {
+                'ok': len(latencies),
+                'errors': sum(isinstance(r, Exception) for r in outcome),
+                'first_error': next((repr(r)[:120] for r in outcome if isinstance(r, Exception)), None),
+                'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0,
+                'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000 if latencies else 0,
+                'max_ms': latencies[-1] * 1000 if latencies else 0,
+                'elapsed': elapsed,
+                'batches': batcher.stats() if name == 'batched' else None
+            }
+    finally:
+        await engine.dispose()
+    return results
+
+
+async def stress(url: str, employees: int, attempts: int, replicas: int, workers: int = CONCURRENT_UPDATES) -> dict:
+    """Every employee taps clock-in and then clock-out `attempts` times at once, spread over
+    `replicas` engines running `workers` handlers each (half of the clock-ins through a
+    batcher, half direct); counts rows and successes."""
+    from sqlalchemy import func
+
+    engines = [scratch_engine(url) for _ in range(replicas)]
+    await create_scratch_tables(engines[0][0], employees)
+    batchers = [ClockInBatcher(session_factory) for _, session_factory in engines]
+    slots = [asyncio.Semaphore(workers) for _ in engines]
+    rng = random.Random(7)
+
+    async def tap_in(employee_id: int, attempt: int):
+        replica = rng.randrange(replicas)
+        async with slots[replica]:
+            if attempt % 2:
+                return employee_id, await batchers[replica].clock_in(employee_id)
+            return employee_id, await clock_in_direct(engines[replica][1], employee_id)
+
+    async def tap_out(employee_id: int):
+        replica = rng.randrange(replicas)
+        async with slots[replica], engines[replica][1]() as db:
+            absensi, status = await clock_out(db, employee_id)
+            await db.commit()
+            return employee_id, status
+
+    taps = [(employee_id, attempt) for employee_id in range(1, employees + 1) for attempt in range(attempts)]
+    rng.shuffle(taps)
+    try:
+        clock_ins = await asyncio.gather(*(tap_in(e, a) for e, a in taps), return_exceptions=True)
+        for batcher in batchers:
+            await batcher.close()
+        clock_outs = await asyncio.gather(*(tap_out(e) for e, _ in taps), return_exceptions=True)
+
+        async with engines[0][1]() as db:
+            rows = dict((await db.execute(
+                select(Absensi.employee_id, func.count()).group_by(Absensi.employee_id, Absensi.tanggal)
+            )).all())
+            stats_rows = await db.scalar(select(func.count()).select_from(AttendanceStats))
+    finally:
+        for engine, _ in engines:
+            await engine.dispose()
+
+    errors = [r for r in clock_ins + clock_outs if isinstance(r, Exception)]
+    ins, outs = {}, {}
+    for employee_id, (_, clocked_in) in (r for r in clock_ins if not isinstance(r, Exception)):
+        ins[employee_id] = ins.get(employee_id, 0) + clocked_in
+    for employee_id, status in (r for r in clock_outs if not isinstance(r, Exception)):
+        outs[employee_id] = outs.get(employee_id, 0) + (status == 'ok')
+
+    expected = range(1, employees + 1)
+    return {
+        'taps': len(taps) * 2,
+        'errors': len(errors),
+        'first_error': repr(errors[0])[:120] if errors else None,
+        'bad_rows': sum(rows.get(e, 0) != 1 for e in expected),
+        'bad_clock_ins': sum(ins.get(e, 0) != 1 for e in expected),
+        'bad_clock_outs': sum(outs.get(e, 0) != 1 for e in expected),
+        'stats_rows': stats_rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clock-ins', type=int, default=2000)
+    parser.add_argument('--seconds', type=float, default=60, help='spread arrivals over this many seconds')
+    parser.add_argument('--mode', choices=['both', 'batched', 'direct'], default='both')
+    parser.add_argument('--stress', action='store_true', help='run the double-tap/replica stress test instead')
+    parser.add_argument('--employees', type=int, default=50)
+    parser.add_argument('--attempts', type=int, default=8, help='parallel taps per employee')
+    parser.add_argument('--replicas', type=int, default=4, help='independent engines, like bot replicas')
+    parser.add_argument('--workers', type=int, default=CONCURRENT_UPDATES, help='concurrent handlers per replica')
+    parser.add_argument('--url', help='async URL of a scratch database, its tables are dropped (default: temp SQLite file)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    url = args.url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'clock_in_bench.db')}"
+    if args.stress:
+        r = asyncio.run(stress(url, args.employees, args.attempts, args.replicas, args.workers))
+        failed = r['errors'] or r['bad_rows'] or r['bad_clock_ins'] or r['bad_clock_outs']
+        print(
+            f"{'FAIL' if failed else 'OK'} {r['taps']} parallel taps from {args.employees} employees on "
+            f"{args.replicas} replicas: {r['errors']} errors, {r['bad_rows']} employees without exactly one row, "
+            f"{r['bad_clock_ins']} without exactly one clock-in, {r['bad_clock_outs']} without exactly one clock-out"
+        )
+        if r['first_error']:
+            print(f"  first error: {r['first_error']}")
+        sys.exit(1 if failed else 0)
+
+    print(f"{args.clock_ins} clock-ins over {args.seconds:g}s on {url}")
+    results = asyncio.run(benchmark(url, args.clock_ins, args.seconds, args.mode))
+    for name, r in results.items():
+        print(
+            f"  {name:<8} ok {r['ok']:>5}  errors {r['errors']:>3}  p50 {r['p50_ms']:7.1f} ms  "
+            f"p99 {r['p99_ms']:7.1f} ms  max {r['max_ms']:7.1f} ms  ({r['elapsed']:.1f}s)"
+        )
+        if r['first_error']:
+            print(f"           first error: {r['first_error']}")
+        if r['batches']:
+            print(f"           {r['batches']}")
+
+
+if __name__ == '__main__':
+    main()
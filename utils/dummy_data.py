@@ -1,5 +1,6 @@
 """Generator untuk dummy data testing."""
 from models import SessionLocal, Employee, Cuti, Absensi, Payroll, KnowledgeBase
+from utils.attendance_stats import rebuild_attendance_stats
 from datetime import datetime, timedelta
 import random
 
@@ -44,8 +45,10 @@ def generate_payroll(months=3):
         
         employees = db.query(Employee).all()
         
+        periode_date = datetime.now().replace(day=1)
         for month in range(months):
-            periode_date = datetime.now() - timedelta(days=30*month)
+            if month:
+                periode_date = (periode_date - timedelta(days=1)).replace(day=1)
             periode = periode_date.strftime('%Y-%m')
             
             for emp in employees:
@@ -128,6 +131,8 @@ def generate_absensi():
                         )
                         db.add(absensi)
         
+        db.flush()
+        rebuild_attendance_stats(db)
         db.commit()
         print("OK Data absensi berhasil dibuat!")
     finally:
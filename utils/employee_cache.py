@@ -0,0 +1,92 @@
+"""Employee lookup cache keyed by telegram_user_id.
+
+Every update starts by resolving the Telegram user to an Employee. The
+cache keeps a detached, read-only snapshot (a namedtuple of the Employee
+columns) per user, so the lookup is a dict hit. Entries expire after
+EMPLOYEE_CACHE_TTL and are dropped whenever an Employee row is inserted,
+updated or deleted through the ORM (registration included). "Not registered"
+is only kept for EMPLOYEE_CACHE_NEGATIVE_TTL seconds: an employee linked by
+another replica or outside the ORM fires no event here.
+"""
+from models import AsyncSessionLocal, Employee
+from sqlalchemy import event, inspect, select
+from config.settings import EMPLOYEE_CACHE_SIZE, EMPLOYEE_CACHE_TTL, EMPLOYEE_CACHE_NEGATIVE_TTL
+from utils.cache import TTLCache
+from collections import namedtuple
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+EmployeeSnapshot = namedtuple('EmployeeSnapshot', [column.key for column in Employee.__table__.columns])
+MISSING = object()
+
+
+def snapshot(employee):
+    if employee is None:
+        return None
+    return EmployeeSnapshot(**{field: getattr(employee, field) for field in EmployeeSnapshot._fields})
+
+
+class EmployeeCache:
+    """TTL cache of EmployeeSnapshot per telegram_user_id (briefly None for unregistered users), counting the queries it saves."""
+
+    def __init__(self, maxsize: int = EMPLOYEE_CACHE_SIZE, ttl: float = EMPLOYEE_CACHE_TTL,
+                 negative_ttl: float = EMPLOYEE_CACHE_NEGATIVE_TTL):
+        self.cache = TTLCache('employee', maxsize=maxsize, ttl=ttl)
+        self.negative_ttl = negative_ttl
+        self._minute = int(time.monotonic() // 60)
+        self._saved_this_minute = 0
+        self._saved_last_minute = 0
+
+    def _roll(self):
+        minute = int(time.monotonic() // 60)
+        if minute != self._minute:
+            self._saved_last_minute = self._saved_this_minute if minute == self._minute + 1 else 0
+            self._saved_this_minute = 0
+            self._minute = minute
+
+    async def get(self, telegram_user_id: int, db=None):
+        """Snapshot of the employee linked to `telegram_user_id`, or None if unregistered."""
+        cached = self.cache.get(telegram_user_id, MISSING)
+        if cached is not MISSING:
+            self._roll()
+            self._saved_this_minute += 1
+            return cached
+
+        query = select(Employee).filter(Employee.telegram_user_id == telegram_user_id)
+        if db is None:
+            async with AsyncSessionLocal() as session:
+                employee = snapshot(await session.scalar(query))
+        else:
+            employee = snapshot(await db.scalar(query))
+        if employee is not None:
+            self.cache.set(telegram_user_id, employee)
+        elif self.negative_ttl > 0:
+            self.cache.set(telegram_user_id, None, ttl=self.negative_ttl)
+        return employee
+
+    def invalidate(self, telegram_user_id: int):
+        self.cache.invalidate(telegram_user_id)
+
+    def stats(self) -> dict:
+        self._roll()
+        return {
+            **self.cache.stats(),
+            'queries_saved': self.cache.hits,
+            'saved_last_minute': self._saved_last_minute
+        }
+
+
+employee_cache = EmployeeCache()
+
+
+@event.listens_for(Employee, 'after_insert')
+@event.listens_for(Employee, 'after_update')
+@event.listens_for(Employee, 'after_delete')
+def _invalidate_employee(mapper, connection, target):
+    # Both the new and any previous telegram_user_id (registration moves it)
+    history = inspect(target).attrs.telegram_user_id.history
+    for telegram_user_id in {target.telegram_user_id, *history.deleted}:
+        if telegram_user_id is not None:
+            employee_cache.invalidate(telegram_user_id)
@@ -0,0 +1,240 @@
+"""Conversation history stores for the AI assistant.
+
+    HISTORY_BACKEND=memory  per-process ring buffers (default)
+    HISTORY_BACKEND=sql     conversation_messages table, shared by every worker
+    HISTORY_BACKEND=redis   Redis lists (REDIS_URL), shared by every worker
+
+`python -m utils.history_store --users 50000` measures the memory used by
+the in-process store next to the old dict-of-lists.
+"""
+from models import SessionLocal, ConversationMessage
+from sqlalchemy import select, delete
+from config.settings import HISTORY_BACKEND, HISTORY_MAX_MESSAGES, HISTORY_IDLE_SECONDS, HISTORY_MAX_USERS, REDIS_URL
+from collections import OrderedDict, deque
+from datetime import datetime
+import argparse
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def as_message(role: str, content: str, timestamp: float) -> dict:
+    return {'role': role, 'content': content, 'timestamp': datetime.fromtimestamp(timestamp)}
+
+
+class MemoryHistoryStore:
+    """user_id -> deque(maxlen) of (role, content, unix time).
+
+    Users are kept in last-write order, so idle users (nothing appended for
+    `idle_seconds`) and the least recent ones beyond `max_users` are
+    dropped from the front in O(1) per user.
+    """
+
+    def __init__(self, maxlen: int = HISTORY_MAX_MESSAGES, idle_seconds: float = HISTORY_IDLE_SECONDS,
+                 max_users: int = HISTORY_MAX_USERS):
+        self.maxlen = maxlen
+        self.idle_seconds = idle_seconds
+        self.max_users = max_users
+        self.evictions = 0
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._users)
+
+    def append(self, user_id: int, role: str, content: str):
+        now = time.time()
+        with self._lock:
+            messages = self._users.get(user_id)
+            if messages is None:
+                messages = self._users[user_id] = deque(maxlen=self.maxlen)
+            else:
+                self._users.move_to_end(user_id)
+            messages.append((role, content, now))
+            self._evict(now)
+
+    def _evict(self, now: float):
+        users = self._users
+        while users:
+            user_id, messages = next(iter(users.items()))
+            if len(users) <= self.max_users and now - messages[-1][2] < self.idle_seconds:
+                break
+            del users[user_id]
+            self.evictions += 1
+
+    def get(self, user_id: int, limit: int = 5) -> list:
+        with self._lock:
+            messages = self._users.get(user_id)
+            if not messages or time.time() - messages[-1][2] >= self.idle_seconds:
+                return []
+            recent = list(messages)[-limit:]
+        return [as_message(*message) for message in recent]
+
+    def clear(self, user_id: int):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+class SQLHistoryStore:
+    """History rows in `conversation_messages`, trimmed to `maxlen` per user."""
+
+    def __init__(self, session_factory=SessionLocal, maxlen: int = HISTORY_MAX_MESSAGES,
+                 idle_seconds: float = HISTORY_IDLE_SECONDS, purge_interval: float = 60):
+        self.session_factory = session_factory
+        self.maxlen = maxlen
+        self.idle_seconds = idle_seconds
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+
+    def append(self, user_id: int, role: str, content: str):
+        db = self.session_factory()
+        try:
+            db.add(ConversationMessage(user_id=user_id, role=role, content=content))
+            db.flush()
+
+            cutoff = db.scalar(
+                select(ConversationMessage.id)
+                .where(ConversationMessage.user_id == user_id)
+                .order_by(ConversationMessage.id.desc())
+                .offset(self.maxlen)
+                .limit(1)
+            )
+            if cutoff is not None:
+                db.execute(delete(ConversationMessage).where(
+                    ConversationMessage.user_id == user_id,
+                    ConversationMessage.id <= cutoff
+                ))
+            db.commit()
+        finally:
+            db.close()
+
+        if time.monotonic() >= self._next_purge:
+            self.purge_idle()
+
+    def purge_idle(self) -> int:
+        """Delete messages older than the idle window."""
+        self._next_purge = time.monotonic() + self.purge_interval
+        db = self.session_factory()
+        try:
+            cutoff = datetime.fromtimestamp(time.time() - self.idle_seconds)
+            result = db.execute(delete(ConversationMessage).where(ConversationMessage.created_at < cutoff))
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
+
+    def get(self, user_id: int, limit: int = 5) -> list:
+        db = self.session_factory()
+        try:
+            cutoff = datetime.fromtimestamp(time.time() - self.idle_seconds)
+            rows = db.execute(
+                select(ConversationMessage.role, ConversationMessage.content, ConversationMessage.created_at)
+                .where(ConversationMessage.user_id == user_id, ConversationMessage.created_at >= cutoff)
+                .order_by(ConversationMessage.id.desc())
+                .limit(limit)
+            ).all()
+        finally:
+            db.close()
+        return [{'role': role, 'content': content, 'timestamp': created_at} for role, content, created_at in reversed(rows)]
+
+    def clear(self, user_id: int):
+        db = self.session_factory()
+        try:
+            db.execute(delete(ConversationMessage).where(ConversationMessage.user_id == user_id))
+            db.commit()
+        finally:
+            db.close()
+
+
+class RedisHistoryStore:
+    """One capped Redis list per user; the key expires after `idle_seconds`."""
+
+    def __init__(self, url: str = REDIS_URL, maxlen: int = HISTORY_MAX_MESSAGES,
+                 idle_seconds: float = HISTORY_IDLE_SECONDS, prefix: str = 'bpkh:history:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+        self.maxlen = maxlen
+        self.idle_seconds = int(idle_seconds)
+        self.prefix = prefix
+
+    def append(self, user_id: int, role: str, content: str):
+        key = f"{self.prefix}{user_id}"
+        pipe = self.client.pipeline()
+        pipe.rpush(key, json.dumps([role, content, time.time()]))
+        pipe.ltrim(key, -self.maxlen, -1)
+        pipe.expire(key, self.idle_seconds)
+        pipe.execute()
+
+    def get(self, user_id: int, limit: int = 5) -> list:
+        items = self.client.lrange(f"{self.prefix}{user_id}", -limit, -1)
+        return [as_message(*json.loads(item)) for item in items]
+
+    def clear(self, user_id: int):
+        self.client.delete(f"{self.prefix}{user_id}")
+
+
+def create_history_store(backend: str = HISTORY_BACKEND):
+    """Store for HISTORY_BACKEND; falls back to memory if it is unavailable."""
+    try:
+        if backend == 'sql':
+            return SQLHistoryStore()
+        if backend == 'redis':
+            return RedisHistoryStore()
+    except Exception as e:
+        logger.error(f"History backend '{backend}' unavailable, using memory: {e}")
+    return MemoryHistoryStore()
+
+
+def main():
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description='Memory use of conversation history')
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--turns', type=int, default=8, help='question/answer pairs per user')
+    args = parser.parse_args()
+
+    question = "Kapan gaji bulan ini dibayarkan dan berapa potongan BPJS saya?"
+    answer = "Gaji dibayarkan setiap tanggal 25. Potongan BPJS Kesehatan 1% dan Ketenagakerjaan 2% dari gaji pokok. " * 2
+
+    def legacy(history, user_id, role, content):
+        # AdvancedRAG.add_to_history before the history stores
+        if user_id not in history:
+            history[user_id] = []
+        history[user_id].append({'role': role, 'content': content, 'timestamp': datetime.now()})
+        if len(history[user_id]) > 10:
+            history[user_id] = history[user_id][-10:]
+
+    def fill(store, append):
+        for turn in range(args.turns):
+            for user_id in range(args.users):
+                append(store, user_id, 'user', question)
+                append(store, user_id, 'assistant', answer)
+
+    def measure(name, make_store, append):
+        start = time.perf_counter()
+        fill(make_store(), append)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        store = make_store()
+        fill(store, append)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:<8} {size / 2**20:>8.1f} MiB  {size / args.users:>7.0f} B/user  {elapsed:>6.2f} s")
+
+    print(f"{args.users} users x {args.turns} turns (message text shared, so the figures are per-entry overhead)")
+    measure('dict', dict, legacy)
+    measure('deque', lambda: MemoryHistoryStore(max_users=args.users), lambda store, *a: store.append(*a))
+
+    bounded = MemoryHistoryStore(max_users=args.users // 5)
+    for user_id in range(args.users):
+        bounded.append(user_id, 'user', question)
+    print(f"max_users={bounded.max_users}: {len(bounded)} kept, {bounded.evictions} evicted")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Hybrid KB retrieval: BM25 + dense embeddings fused with reciprocal rank fusion."""
+from utils.kb_index import kb_index
+from utils.vector_index import dense_index
+from config.settings import DENSE_MIN_SCORE, HYBRID_RRF_K, HYBRID_CANDIDATES, LLM_MAX_CONCURRENCY
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = HYBRID_RRF_K, weights: list = None) -> list:
+    """Fuse ranked entry lists: score(d) = sum_i w_i / (k + rank_i(d))."""
+    weights = weights or [1.0] * len(rankings)
+    scores = defaultdict(float)
+    entries = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, entry in enumerate(ranking, 1):
+            scores[entry.id] += weight / (k + rank)
+            entries.setdefault(entry.id, entry)
+
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(entries[entry_id], score) for entry_id, score in fused]
+
+
+class HybridRetriever:
+    """Runs the lexical and dense retrievers concurrently and fuses their rankings.
+
+    The dense ranking (query embedding) goes to a pool with one thread per
+    concurrent AI request; the cheap BM25 ranking runs on the calling thread
+    meanwhile, so parallel chats do not queue behind each other's retrieval.
+    """
+
+    def __init__(self, lexical=kb_index, dense=dense_index, rrf_k: int = HYBRID_RRF_K,
+                 candidates: int = HYBRID_CANDIDATES, min_dense_score: float = DENSE_MIN_SCORE,
+                 workers: int = LLM_MAX_CONCURRENCY):
+        self.lexical = lexical
+        self.dense = dense
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.min_dense_score = min_dense_score
+        self.executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='hybrid')
+
+    def lexical_ranking(self, terms: list) -> list:
+        return [entry for entry, score in self.lexical.search(terms, top_k=self.candidates)]
+
+    def dense_ranking(self, query: str) -> list:
+        return [
+            entry for entry, score in self.dense.search(query, top_k=self.candidates)
+            if score >= self.min_dense_score
+        ]
+
+    def search(self, query: str, terms: list, top_k: int = 3) -> list:
+        """Returns [(entry, rrf_score), ...]."""
+        dense = self.executor.submit(self.dense_ranking, query)
+
+        rankings = [self.lexical_ranking(terms)]
+        try:
+            rankings.append(dense.result())
+        except Exception as e:
+            logger.error(f"Dense retrieval failed, using BM25 only: {e}")
+
+        return reciprocal_rank_fusion(rankings, k=self.rrf_k)[:top_k]
+
+
+hybrid_retriever = HybridRetriever()
@@ -0,0 +1,239 @@
+"""Bulk ingestion of HR policy documents into the knowledge base.
+
+    python -m utils.ingest DOCS_DIR [--kategori kebijakan] [--workers 4] [--prune]
+
+Walks DOCS_DIR for PDF/DOCX/XLSX/PPTX/TXT/MD files and stores one
+KnowledgeBase row per file (`source_path`, `source_hash`). Files whose
+SHA-256 matches the stored hash are skipped, so an interrupted run resumes
+where it stopped. Text is extracted in a process pool; rows are written in
+batches, then chunked and embedded (vectors persisted on the chunks).
+"""
+from models import SessionLocal, KnowledgeBase, init_db
+from sqlalchemy import select, insert, update, delete
+from config.settings import INGEST_BATCH_SIZE
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sys
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'.pdf', '.docx', '.xlsx', '.pptx', '.txt', '.md'}
+BLANKS_RE = re.compile(r'[ \t]+')
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_pdf(path: Path) -> tuple:
+    from PyPDF2 import PdfReader
+    reader = PdfReader(str(path))
+    title = reader.metadata.title if reader.metadata else None
+    return title, '\n\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def extract_docx(path: Path) -> tuple:
+    import docx
+    document = docx.Document(str(path))
+    parts = [paragraph.text for paragraph in document.paragraphs]
+    for table in document.tables:
+        for row in table.rows:
+            parts.append(' | '.join(cell.text.strip() for cell in row.cells))
+    return document.core_properties.title, '\n'.join(parts)
+
+
+def extract_xlsx(path: Path) -> tuple:
+    from openpyxl import load_workbook
+    workbook = load_workbook(str(path), read_only=True, data_only=True)
+    try:
+        parts = []
+        for sheet in workbook.worksheets:
+            parts.append(f"{sheet.title}:")
+            for row in sheet.iter_rows(values_only=True):
+                cells = [str(cell) for cell in row if cell is not None and str(cell).strip()]
+                if cells:
+                    parts.append(' | '.join(cells))
+            parts.append('')
+        return workbook.properties.title, '\n'.join(parts)
+    finally:
+        workbook.close()
+
+
+def extract_pptx(path: Path) -> tuple:
+    from pptx import Presentation
+    presentation = Presentation(str(path))
+    parts = []
+    for slide in presentation.slides:
+        for shape in slide.shapes:
+            if shape.has_text_frame:
+                parts.append(shape.text_frame.text)
+        parts.append('')
+    return presentation.core_properties.title, '\n'.join(parts)
+
+
+def extract_text_file(path: Path) -> tuple:
+    return None, path.read_text(encoding='utf-8', errors='replace')
+
+
+EXTRACTORS = {
+    '.pdf': extract_pdf,
+    '.docx': extract_docx,
+    '.xlsx': extract_xlsx,
+    '.pptx': extract_pptx,
+    '.txt': extract_text_file,
+    '.md': extract_text_file,
+}
+
+
+def extract(path: str) -> tuple:
+    """Worker: (path, title, text). Runs in a separate process."""
+    path = Path(path)
+    title, text = EXTRACTORS[path.suffix.lower()](path)
+    text = BLANK_LINES_RE.sub('\n\n', BLANKS_RE.sub(' ', text or '')).strip()
+    title = (title or '').strip() or path.stem.replace('_', ' ').replace('-', ' ').strip()
+    return str(path), title[:200], text
+
+
+def scan(root: Path) -> list:
+    return sorted(
+        path for path in root.rglob('*')
+        if path.is_file() and path.suffix.lower() in EXTENSIONS and not path.name.startswith('~$')
+    )
+
+
+def write_batch(db, rows: list, existing: dict, kategori: str) -> tuple:
+    """Insert new files and update changed ones in one transaction."""
+    now = datetime.now()
+    inserts, updates = [], []
+    for path, file_digest, title, text in rows:
+        values = {
+            'judul': title,
+            'konten': text,
+            'tags': Path(path).suffix.lstrip('.').lower(),
+            'source_hash': file_digest,
+            'updated_at': now,
+        }
+        if path in existing:
+            updates.append({'id': existing[path][0], **values})
+        else:
+            inserts.append({'kategori': kategori, 'source_path': path, 'created_at': now, **values})
+
+    if inserts:
+        db.execute(insert(KnowledgeBase), inserts)
+    if updates:
+        db.execute(update(KnowledgeBase), updates)
+    db.commit()
+    return len(inserts), len(updates)
+
+
+def ingest(root: Path, kategori: str, workers: int, prune: bool = False, embed: bool = True) -> dict:
+    from utils.chunking import chunk_sync
+
+    root = root.resolve()
+    db = SessionLocal()
+    try:
+        existing = {
+            path: (kb_id, digest)
+            for kb_id, path, digest in db.execute(
+                select(KnowledgeBase.id, KnowledgeBase.source_path, KnowledgeBase.source_hash)
+                .where(KnowledgeBase.source_path.startswith(f"{root}{os.sep}", autoescape=True))
+            )
+        }
+
+        files = scan(root)
+        pending = {}
+        for path in files:
+            digest = file_hash(path)
+            if existing.get(str(path), (None, None))[1] != digest:
+                pending[str(path)] = digest
+
+        result = {'files': len(files), 'unchanged': len(files) - len(pending), 'inserted': 0,
+                  'updated': 0, 'failed': 0, 'pruned': 0}
+        logger.info(f"{len(files)} files, {len(pending)} new or changed")
+
+        batch = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(extract, path): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    _, title, text = future.result()
+                except Exception as e:
+                    # Hash is not stored, so the file is retried on the next run
+                    result['failed'] += 1
+                    logger.error(f"Failed to extract {path}: {e}")
+                    continue
+                if not text:
+                    result['failed'] += 1
+                    logger.warning(f"No text in {path}")
+                    continue
+
+                batch.append((path, pending[path], title, text))
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    inserted, updated = write_batch(db, batch, existing, kategori)
+                    result['inserted'] += inserted
+                    result['updated'] += updated
+                    batch = []
+
+        if batch:
+            inserted, updated = write_batch(db, batch, existing, kategori)
+            result['inserted'] += inserted
+            result['updated'] += updated
+
+        if prune:
+            present = {str(path) for path in files}
+            gone = [kb_id for path, (kb_id, _) in existing.items() if path not in present]
+            if gone:
+                db.execute(delete(KnowledgeBase).where(KnowledgeBase.id.in_(gone)))
+                db.commit()
+            result['pruned'] = len(gone)
+    finally:
+        db.close()
+
+    entries, written, deleted = chunk_sync.sync(force=True)
+    result['chunks_written'] = written
+    result['chunks_deleted'] = deleted
+
+    if embed and written:
+        from utils.vector_index import dense_index
+        dense_index.refresh(force=True)
+        result['vectors'] = len(dense_index)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', type=Path)
+    parser.add_argument('--kategori', default='kebijakan')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--prune', action='store_true', help='delete entries whose file is gone')
+    parser.add_argument('--no-embed', action='store_true', help='skip embedding (done lazily by the bot)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if not args.directory.is_dir():
+        parser.error(f"{args.directory} is not a directory")
+
+    init_db()
+    result = ingest(args.directory, args.kategori, args.workers, prune=args.prune, embed=not args.no_embed)
+    print(
+        f"OK {result['files']} files: {result['inserted']} inserted, {result['updated']} updated, "
+        f"{result['unchanged']} unchanged, {result['failed']} failed, {result['pruned']} pruned; "
+        f"{result['chunks_written']} chunks written"
+    )
+    sys.exit(1 if result['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""In-memory inverted index (BM25) untuk knowledge base."""
+from models import SessionLocal, KnowledgeBase, KnowledgeChunk
+from utils.chunking import chunk_sync
+from utils.text import tokenize
+from sqlalchemy import event, func
+from sqlalchemy.orm import defer
+from config.settings import KB_INDEX_REFRESH_SECONDS
+from collections import defaultdict
+import heapq
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TITLE_BONUS = 5
+
+
+class KBIndex:
+    """Inverted index token -> {entry_id: tf} over judul/konten/tags.
+
+    Entries are KnowledgeChunk passages (see utils.chunking), kept in sync
+    with `KnowledgeChunk.updated_at`: a cheap
+    `count(id), max(updated_at)` probe (throttled to once per
+    `refresh_interval` seconds) decides whether to reload changed rows.
+    """
+
+    def __init__(self, refresh_interval: float = KB_INDEX_REFRESH_SECONDS, k1: float = 1.5, b: float = 0.75):
+        self.refresh_interval = refresh_interval
+        self.k1 = k1
+        self.b = b
+        self.entries = {}
+        self.postings = defaultdict(dict)
+        self.title_postings = defaultdict(set)
+        self.doc_terms = {}
+        self.doc_len = {}
+        self.total_len = 0
+        self.impacts = {}
+        self.watermark = None
+        self._dirty = False
+        self._stale = True
+        self._last_check = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def mark_stale(self):
+        """Force a DB probe on the next search."""
+        self._stale = True
+
+    def add(self, entry):
+        """Index (or re-index) one KnowledgeChunk (or any entry-like object)."""
+        with self._lock:
+            if entry.id in self.entries:
+                self.remove(entry.id)
+
+            tokens = tokenize(f"{entry.judul} {entry.konten} {entry.tags}")
+            tf = defaultdict(int)
+            for token in tokens:
+                tf[token] += 1
+
+            for token, count in tf.items():
+                self.postings[token][entry.id] = count
+            for token in set(tokenize(entry.judul)):
+                self.title_postings[token].add(entry.id)
+
+            self.entries[entry.id] = entry
+            self.doc_terms[entry.id] = list(tf)
+            self.doc_len[entry.id] = len(tokens)
+            self.total_len += len(tokens)
+
+            if entry.updated_at and (self.watermark is None or entry.updated_at > self.watermark):
+                self.watermark = entry.updated_at
+            self._dirty = True
+
+    def remove(self, entry_id: int):
+        """Drop one entry from the index."""
+        with self._lock:
+            entry = self.entries.pop(entry_id, None)
+            if entry is None:
+                return
+
+            for token in self.doc_terms.pop(entry_id):
+                postings = self.postings[token]
+                postings.pop(entry_id, None)
+                if not postings:
+                    del self.postings[token]
+            for token in set(tokenize(entry.judul)):
+                ids = self.title_postings.get(token)
+                if ids is not None:
+                    ids.discard(entry_id)
+                    if not ids:
+                        del self.title_postings[token]
+
+            self.total_len -= self.doc_len.pop(entry_id)
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.postings.clear()
+            self.title_postings.clear()
+            self.doc_terms.clear()
+            self.doc_len.clear()
+            self.impacts.clear()
+            self.total_len = 0
+            self.watermark = None
+            self._dirty = False
+
+    def load_entries(self, entries: list):
+        """Index a fixed set of entries instead of the table (evaluation)."""
+        with self._lock:
+            self.clear()
+            for entry in entries:
+                self.add(entry)
+            self._compute_impacts()
+            self._stale = False
+            self.refresh_interval = float('inf')
+
+    def refresh(self, force: bool = False):
+        """Sync with the knowledge_chunks table if it changed."""
+        now = time.monotonic()
+        if not force and not self._stale and now - self._last_check < self.refresh_interval:
+            return
+
+        chunk_sync.sync(force=force)
+        db = SessionLocal()
+        try:
+            with self._lock:
+                self._last_check = now
+                self._stale = False
+
+                count, latest = db.query(
+                    func.count(KnowledgeChunk.id),
+                    func.max(KnowledgeChunk.updated_at)
+                ).one()
+
+                if count == len(self.entries) and latest == self.watermark:
+                    return
+
+                chunks = db.query(KnowledgeChunk).options(defer(KnowledgeChunk.embedding))
+                if self.watermark is None:
+                    changed = chunks.all()
+                else:
+                    changed = chunks.filter(
+                        (KnowledgeChunk.updated_at >= self.watermark) | (KnowledgeChunk.updated_at.is_(None))
+                    ).all()
+
+                for entry in changed:
+                    self.add(entry)
+
+                if count != len(self.entries):
+                    live_ids = {row[0] for row in db.query(KnowledgeChunk.id).all()}
+                    for entry_id in set(self.entries) - live_ids:
+                        self.remove(entry_id)
+
+                self._compute_impacts()
+                logger.info(f"KB index refreshed: {len(changed)} updated, {len(self.entries)} total")
+        finally:
+            db.close()
+
+    def _compute_impacts(self):
+        """Precompute BM25 term weights per posting so queries only sum."""
+        if not self._dirty:
+            return
+
+        n = len(self.entries)
+        avgdl = (self.total_len / n) if n else 1.0
+        k1, b = self.k1, self.b
+        norm = {
+            entry_id: k1 * (1 - b + b * length / avgdl)
+            for entry_id, length in self.doc_len.items()
+        }
+
+        impacts = {}
+        for token, postings in self.postings.items():
+            df = len(postings)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            impacts[token] = [
+                (entry_id, idf * tf * (k1 + 1) / (tf + norm[entry_id]))
+                for entry_id, tf in postings.items()
+            ]
+
+        self.impacts = impacts
+        self._dirty = False
+
+    def search(self, terms: list, top_k: int = 3) -> list:
+        """BM25 + title bonus ranking. Returns [(entry, score), ...]."""
+        self.refresh()
+
+        with self._lock:
+            self._compute_impacts()
+
+            scores = defaultdict(float)
+            for term in set(terms):
+                for entry_id, weight in self.impacts.get(term, ()):
+                    scores[entry_id] += weight
+
+            titled = set()
+            for term in set(terms):
+                titled.update(self.title_postings.get(term, ()))
+            for entry_id in titled:
+                if entry_id in scores:
+                    scores[entry_id] += TITLE_BONUS
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [(self.entries[entry_id], score) for entry_id, score in best]
+
+
+kb_index = KBIndex()
+
+
+@event.listens_for(KnowledgeBase, 'after_insert')
+@event.listens_for(KnowledgeBase, 'after_update')
+@event.listens_for(KnowledgeBase, 'after_delete')
+def _mark_kb_index_stale(mapper, connection, target):
+    kb_index.mark_stale()
@@ -0,0 +1,130 @@
+"""Token-budgeted prompt assembly for the AI assistant."""
+from utils.text import tokenize, estimate_tokens, CHARS_PER_TOKEN
+from config.settings import PROMPT_TOKEN_BUDGET, PROMPT_KB_TOKENS, PROMPT_HISTORY_MESSAGES
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+MESSAGE_OVERHEAD = 4
+
+
+def snippet(text: str, terms: set, max_tokens: int) -> str:
+    """Sentences of `text` that mention `terms` most, in original order, within `max_tokens`."""
+    if max_tokens <= 0 or not text:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    sentences = [s.strip() for s in SENTENCE_RE.split(text) if s.strip()]
+    hits = [len(terms.intersection(tokenize(sentence))) for sentence in sentences]
+    matched = [i for i, hit in enumerate(hits) if hit] or [0]
+    # Matching sentences first, then their neighbours as context
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-hits[i], min(abs(i - j) for j in matched), i)
+    )
+
+    chosen, used = [], 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        chosen.append(i)
+        used += cost
+
+    if not chosen:
+        # A single sentence is over budget on its own: cut it
+        return sentences[ranked[0]][:int(max_tokens * CHARS_PER_TOKEN)].rstrip() + " ..."
+
+    chosen.sort()
+    parts = [sentences[chosen[0]]]
+    for prev, i in zip(chosen, chosen[1:]):
+        parts.append(sentences[i] if i == prev + 1 else f"... {sentences[i]}")
+    return " ".join(parts)
+
+
+class PromptBuilder:
+    """Fits system prompt + KB snippets + history + query into `budget` tokens.
+
+    The template, employee context and query are always kept. KB entries
+    share at most `kb_tokens` and are cut down to the sentences matching the
+    query terms; history fills what is left, newest first, so the oldest
+    turns are the first to go.
+    """
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET, kb_tokens: int = PROMPT_KB_TOKENS,
+                 history_messages: int = PROMPT_HISTORY_MESSAGES):
+        self.budget = budget
+        self.kb_tokens = kb_tokens
+        self.history_messages = history_messages
+        self.requests = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.truncated_kb = 0
+        self.dropped_history = 0
+        self._lock = threading.Lock()
+
+    def build(self, template: str, query: str, terms: list, kb_entries: list, emp_context: str = "",
+              history: list = None, empty_kb: str = "Tidak ada info dari KB.") -> list:
+        history = (history or [])[-self.history_messages:]
+        terms = set(terms)
+
+        fixed = (
+            estimate_tokens(template.format(kb_context="", emp_context=emp_context))
+            + estimate_tokens(query) + 2 * MESSAGE_OVERHEAD
+        )
+        remaining = max(self.budget - fixed, 0)
+
+        kb_parts, truncated = [], 0
+        if kb_entries:
+            per_entry = min(self.kb_tokens, remaining) // len(kb_entries)
+            for entry in kb_entries:
+                header = f"{entry.judul}: "
+                body = snippet(entry.konten or "", terms, per_entry - estimate_tokens(header))
+                if body != entry.konten:
+                    truncated += 1
+                kb_parts.append(header + body)
+        kb_context = "\n\n".join(kb_parts) if kb_parts else empty_kb
+        kb_used = estimate_tokens(kb_context)
+        remaining -= kb_used
+
+        kept = []
+        for msg in reversed(history):
+            cost = estimate_tokens(msg['content']) + MESSAGE_OVERHEAD
+            if cost > remaining:
+                break
+            kept.append({"role": msg['role'], "content": msg['content']})
+            remaining -= cost
+        kept.reverse()
+
+        system_prompt = template.format(kb_context=kb_context, emp_context=emp_context)
+        messages = [{"role": "system", "content": system_prompt}, *kept, {"role": "user", "content": query}]
+        total = sum(estimate_tokens(m['content']) + MESSAGE_OVERHEAD for m in messages)
+
+        with self._lock:
+            self.requests += 1
+            self.total_tokens += total
+            self.max_tokens = max(self.max_tokens, total)
+            self.truncated_kb += truncated
+            self.dropped_history += len(history) - len(kept)
+
+        logger.info(
+            f"Prompt ~{total} tokens (budget {self.budget}): kb {kb_used} "
+            f"[{truncated}/{len(kb_entries)} snipped], history {len(kept)}/{len(history)} msgs"
+        )
+        return messages
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'avg_tokens': round(self.total_tokens / self.requests) if self.requests else 0,
+            'max_tokens': self.max_tokens,
+            'truncated_kb': self.truncated_kb,
+            'dropped_history': self.dropped_history
+        }
+
+
+prompt_builder = PromptBuilder()
@@ -0,0 +1,261 @@
+"""Per-handler query instrumentation.
+
+SQLAlchemy cursor events on both engines time every statement and attribute
+it to the handler processing the current update (a contextvar set by
+`track()`; e.g. "callback:clock_in", "command:/start", "message"). Each
+update records its query count, DB time and total time; statements slower
+than SLOW_QUERY_SECONDS are logged with their plan. Everything is exported
+as Prometheus histograms, together with cache and pool gauges, at
+http://METRICS_HOST:METRICS_PORT/metrics when polling, or at /metrics on the
+webhook app (local clients only) in webhook mode.
+
+Handlers registered with block=False outlive their update's `track()`; their
+queries still count per statement, and a handler that wants per-update totals
+opens its own `track()` (bot.py's AI chats record under "ai_chat").
+"""
+from models import engine, async_engine
+from sqlalchemy import event
+from config.settings import SLOW_QUERY_SECONDS, METRICS_HOST, METRICS_PORT
+from telegram import Update
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+current_handler = ContextVar('current_handler', default='background')
+current_update = ContextVar('current_update', default=None)
+
+MAX_LABELS = 200
+MAX_EXPLAINED = 256
+QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+UPDATE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Prometheus histogram with a single `handler` label."""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label: str, value: float):
+        with self._lock:
+            if label not in self.series and len(self.series) >= MAX_LABELS:
+                label = 'other'
+            series = self.series.setdefault(label, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label, (counts, total, count) in sorted(self.series.items()):
+                handler = f'handler="{escape(label)}"'
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{handler},le="{bound:g}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{handler},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{handler}}} {total:.6f}")
+                lines.append(f"{self.name}_count{{{handler}}} {count}")
+        return lines
+
+
+class QueryMetrics:
+    """Histograms per handler plus gauge collectors (caches, pools)."""
+
+    def __init__(self):
+        self.query_seconds = Histogram('bpkh_db_query_seconds', 'Duration of each SQL statement.', QUERY_BUCKETS)
+        self.update_queries = Histogram('bpkh_update_queries', 'SQL statements issued per update.', COUNT_BUCKETS)
+        self.update_db_seconds = Histogram('bpkh_update_db_seconds', 'Time spent in SQL per update.', UPDATE_BUCKETS)
+        self.update_seconds = Histogram('bpkh_update_seconds', 'Time to process an update.', UPDATE_BUCKETS)
+        self.slow_queries = {}
+        self.collectors = {}
+        self._explained = set()
+        self._lock = threading.Lock()
+
+    def register(self, prefix: str, label: str, collect):
+        """Export `collect()` -> {label_value: {stat: number}} as gauges `<prefix>_<stat>`."""
+        self.collectors[prefix] = (label, collect)
+
+    def record_query(self, statement: str, seconds: float, explain=None):
+        handler = current_handler.get()
+        self.query_seconds.observe(handler, seconds)
+        stats = current_update.get()
+        if stats is not None:
+            stats['queries'] += 1
+            stats['db_seconds'] += seconds
+
+        if seconds < SLOW_QUERY_SECONDS:
+            return
+        with self._lock:
+            self.slow_queries[handler] = self.slow_queries.get(handler, 0) + 1
+            # Plan only the first time a statement is slow; it rarely changes
+            first = statement not in self._explained and len(self._explained) < MAX_EXPLAINED
+            if first:
+                self._explained.add(statement)
+        plan = explain() if first and explain else None
+        logger.warning(
+            f"Slow query ({seconds * 1000:.0f} ms) in {handler}: {' '.join(statement.split())[:500]}"
+            + (f"\n    plan: {plan}" if plan else "")
+        )
+
+    def render(self) -> str:
+        lines = []
+        for histogram in (self.query_seconds, self.update_queries, self.update_db_seconds, self.update_seconds):
+            lines += histogram.render()
+
+        lines += ["# HELP bpkh_slow_queries_total SQL statements slower than SLOW_QUERY_SECONDS.",
+                  "# TYPE bpkh_slow_queries_total counter"]
+        with self._lock:
+            for handler, count in sorted(self.slow_queries.items()):
+                lines.append(f'bpkh_slow_queries_total{{handler="{escape(handler)}"}} {count}')
+
+        for prefix, (label, collect) in self.collectors.items():
+            try:
+                groups = collect()
+            except Exception as e:
+                logger.error(f"Metrics collector {prefix} failed: {e}")
+                continue
+            gauges = {}
+            for label_value, stats in groups.items():
+                for stat, value in stats.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        gauges.setdefault(stat, []).append(f'{prefix}_{stat}{{{label}="{escape(label_value)}"}} {value}')
+            for stat, samples in gauges.items():
+                lines += [f"# TYPE {prefix}_{stat} gauge", *samples]
+        return '\n'.join(lines) + '\n'
+
+
+query_metrics = QueryMetrics()
+
+
+def handler_label(update: object) -> str:
+    if not isinstance(update, Update):
+        return 'other'
+    if update.callback_query:
+        return f"callback:{(update.callback_query.data or '')[:64]}"
+    message = update.effective_message
+    if message and message.text and message.text.startswith('/'):
+        return f"command:{message.text.split()[0].split('@')[0][:32]}"
+    if message:
+        return 'message'
+    return 'other'
+
+
+@contextmanager
+def track(label: str):
+    """Attribute queries in this block to `label` and record per-update totals."""
+    stats = {'queries': 0, 'db_seconds': 0.0}
+    label_token = current_handler.set(label)
+    stats_token = current_update.set(stats)
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        elapsed = time.perf_counter() - start
+        current_update.reset(stats_token)
+        current_handler.reset(label_token)
+        query_metrics.update_queries.observe(label, stats['queries'])
+        query_metrics.update_db_seconds.observe(label, stats['db_seconds'])
+        query_metrics.update_seconds.observe(label, elapsed)
+        logger.debug(
+            f"{label}: {stats['queries']} queries, {stats['db_seconds'] * 1000:.1f} ms in DB, "
+            f"{elapsed * 1000:.1f} ms total"
+        )
+
+
+def label_background(label: str):
+    """Tag queries of a long-running task (it would otherwise inherit the update that started it)."""
+    current_handler.set(label)
+    current_update.set(None)
+
+
+def explain_plan(connection, statement: str, parameters) -> str:
+    cursor = connection.connection.cursor()
+    try:
+        prefix = 'EXPLAIN QUERY PLAN' if connection.dialect.name == 'sqlite' else 'EXPLAIN'
+        cursor.execute(f"{prefix} {statement}", parameters)
+        return ' | '.join(str(row[-1] if connection.dialect.name == 'sqlite' else row[0]) for row in cursor.fetchall())
+    except Exception as e:
+        return f"unavailable ({e})"
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    explain = None
+    if not executemany and statement.lstrip()[:6].upper() == 'SELECT':
+        explain = lambda: explain_plan(conn, statement, parameters)
+    query_metrics.record_query(statement, seconds, explain)
+
+
+def _handle_error(context):
+    # A failed statement gets no after_cursor_execute; drop its start time so the
+    # stack does not grow and the next statement on this connection is timed right
+    conn = context.connection
+    if conn is not None and context.execution_context is not None:
+        starts = conn.info.get('query_start')
+        if starts:
+            starts.pop()
+
+
+for bind in (engine, async_engine.sync_engine):
+    event.listen(bind, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(bind, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(bind, 'handle_error', _handle_error)
+
+
+async def _handle_metrics(reader, writer):
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        while (await reader.readline()).strip():
+            pass
+        if len(request_line) >= 2 and request_line[0] == 'GET' and request_line[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', query_metrics.render().encode()
+        else:
+            status, body = '404 Not Found', b'not found\n'
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Local /metrics endpoint; returns the server (None when METRICS_PORT is 0 or cannot be bound)."""
+    if not port:
+        return None
+    try:
+        server = await asyncio.start_server(_handle_metrics, host, port)
+    except OSError as e:
+        # Metrics are optional; a taken port (e.g. a second bot on this host) must not stop the bot
+        logger.warning(f"Metrics server not started on {host}:{port}: {e}")
+        return None
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+    return server
@@ -1,40 +1,61 @@
 """RAG Engine menggunakan Groq API (pengganti OpenAI)."""
+import logging
 import os
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import Chroma
-from langchain_groq import ChatGroq
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from config.settings import GROQ_API_KEY, CHROMA_DB_PATH, EMBEDDING_MODEL, LLM_MODEL
+import threading
+from config.settings import GROQ_API_KEY, CHROMA_DB_PATH, EMBEDDING_MODEL, LLM_MODEL, CHROMA_BATCH_SIZE
+from models import SessionLocal, KnowledgeChunk
+from utils.chunking import split_text, chunk_ids, content_hash, chunk_sync
+
+logger = logging.getLogger(__name__)
 
 class RAGEngine:
     """RAG Engine untuk menjawab pertanyaan berdasarkan knowledge base."""
     
     def __init__(self):
-        """Initialize RAG engine with Groq."""
-        # Use local embeddings (free & fast)
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
-        
-        # Initialize vector store
-        self.vectorstore = Chroma(
-            persist_directory=CHROMA_DB_PATH,
-            embedding_function=self.embeddings
-        )
-        
-        # Initialize Groq LLM
-        self.llm = ChatGroq(
-            groq_api_key=GROQ_API_KEY,
-            model_name=LLM_MODEL,
-            temperature=0.3,
-            max_tokens=1024
-        )
-        
-        # Custom prompt template untuk HR Bot
-        template = """Kamu adalah asisten HR BPKH (Badan Pengelola Keuangan Haji) yang membantu karyawan dengan pertanyaan seputar kebijakan perusahaan, prosedur, dan informasi HR. 
+        """Cheap: langchain, the embedding model and Chroma load on first use or via preload()."""
+        self.embeddings = None
+        self.vectorstore = None
+        self.llm = None
+        self.qa_chain = None
+        self.ready = threading.Event()
+        self._load_lock = threading.Lock()
+    
+    def load(self):
+        """Initialize RAG engine with Groq (blocking, idempotent)."""
+        if self.ready.is_set():
+            return
+        with self._load_lock:
+            if self.ready.is_set():
+                return
+            from langchain.embeddings import HuggingFaceEmbeddings
+            from langchain.vectorstores import Chroma
+            from langchain_groq import ChatGroq
+            from langchain.chains import RetrievalQA
+            from langchain.prompts import PromptTemplate
+            
+            # Use local embeddings (free & fast)
+            self.embeddings = HuggingFaceEmbeddings(
+                model_name=EMBEDDING_MODEL,
+                model_kwargs={'device': 'cpu'},
+                encode_kwargs={'normalize_embeddings': True}
+            )
+            
+            # Initialize vector store
+            self.vectorstore = Chroma(
+                persist_directory=CHROMA_DB_PATH,
+                embedding_function=self.embeddings
+            )
+            
+            # Initialize Groq LLM
+            self.llm = ChatGroq(
+                groq_api_key=GROQ_API_KEY,
+                model_name=LLM_MODEL,
+                temperature=0.3,
+                max_tokens=1024
+            )
+            
+            # Custom prompt template untuk HR Bot
+            template = """Kamu adalah asisten HR BPKH (Badan Pengelola Keuangan Haji) yang membantu karyawan dengan pertanyaan seputar kebijakan perusahaan, prosedur, dan informasi HR. 
 
 Berdasarkan konteks berikut, jawab pertanyaan dengan ramah, informatif, dan profesional.
 
@@ -43,29 +64,126 @@ Konteks: {context}
 Pertanyaan: {question}
 
 Jawaban (dalam Bahasa Indonesia yang sopan dan mudah dipahami):"""
+            
+            PROMPT = PromptTemplate(
+                template=template,
+                input_variables=["context", "question"]
+            )
+            
+            # Create QA chain
+            self.qa_chain = RetrievalQA.from_chain_type(
+                llm=self.llm,
+                chain_type="stuff",
+                retriever=self.vectorstore.as_retriever(search_kwargs={"k": 3}),
+                chain_type_kwargs={"prompt": PROMPT}
+            )
+            
+            self.ready.set()
+            logger.info("RAG engine loaded")
+    
+    def preload(self, documents=None) -> threading.Thread:
+        """Load and sync the knowledge base (initialize_knowledge_base) in a daemon
+        thread so startup is not blocked; query() waits for the load."""
+        def run():
+            try:
+                self.initialize_knowledge_base(documents)
+            except Exception as e:
+                logger.error(f"RAG engine preload failed: {e}")
         
-        PROMPT = PromptTemplate(
-            template=template,
-            input_variables=["context", "question"]
-        )
-        
-        # Create QA chain
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=self.vectorstore.as_retriever(search_kwargs={"k": 3}),
-            chain_type_kwargs={"prompt": PROMPT}
-        )
+        thread = threading.Thread(target=run, name='rag-engine-load', daemon=True)
+        thread.start()
+        return thread
     
     def query(self, question: str) -> str:
         """Query the RAG engine."""
         try:
+            self.load()
             result = self.qa_chain.run(question)
             return result
         except Exception as e:
             return f"Maaf, terjadi kesalahan: {str(e)}\n\nPastikan Groq API key sudah benar di .env file."
     
     def add_documents(self, documents):
-        """Add documents to vector store."""
-        self.vectorstore.add_documents(documents)
+        """Add documents to vector store, split into overlapping chunks."""
+        from langchain.schema import Document
+        
+        self.load()
+        chunks = [
+            Document(page_content=text, metadata={**doc.metadata, 'chunk': ordinal})
+            for doc in documents
+            for ordinal, text in enumerate(split_text(doc.page_content))
+        ]
+        for start in range(0, len(chunks), CHROMA_BATCH_SIZE):
+            self.vectorstore.add_documents(chunks[start:start + CHROMA_BATCH_SIZE])
         self.vectorstore.persist()
+    
+    def knowledge_chunks(self, documents=None) -> dict:
+        """{chunk id: (text, metadata)} for `documents` or, by default, the KB table.
+        
+        `documents` items are dicts with `id`, `judul`, `konten` and optional
+        `tags`; KB rows come pre-chunked from knowledge_chunks.
+        """
+        if documents is None:
+            chunk_sync.sync(force=True)
+            db = SessionLocal()
+            try:
+                rows = db.query(
+                    KnowledgeChunk.id, KnowledgeChunk.knowledge_base_id, KnowledgeChunk.judul,
+                    KnowledgeChunk.konten, KnowledgeChunk.content_hash
+                ).all()
+            finally:
+                db.close()
+            return {
+                f"kb-{cid}": (f"{judul}\n{konten}", {'kb_id': kb_id, 'judul': judul, 'content_hash': digest})
+                for cid, kb_id, judul, konten, digest in rows
+            }
+        
+        chunks = {}
+        for doc in documents:
+            texts = split_text(doc['konten']) or [doc['konten']]
+            digests = [content_hash(doc['judul'], text, doc.get('tags')) for text in texts]
+            for text, digest, cid in zip(texts, digests, chunk_ids(doc['id'], digests)):
+                chunks[f"doc-{cid}"] = (
+                    f"{doc['judul']}\n{text}",
+                    {'doc_id': str(doc['id']), 'judul': doc['judul'], 'content_hash': digest}
+                )
+        return chunks
+    
+    def initialize_knowledge_base(self, documents=None) -> dict:
+        """Bring the Chroma collection in line with the knowledge base.
+        
+        Compares chunk ids + content hashes with what the persistent
+        collection already holds and only embeds new/changed chunks and
+        deletes vanished ones, in batches, persisting once at the end.
+        Only ids with the same prefix (kb- or doc-) are considered, so
+        documents added through add_documents are left alone.
+        """
+        self.load()
+        wanted = self.knowledge_chunks(documents)
+        prefix = 'kb-' if documents is None else 'doc-'
+        
+        stored = self.vectorstore.get(include=['metadatas'])
+        current = {
+            chunk_key: (metadata or {}).get('content_hash')
+            for chunk_key, metadata in zip(stored['ids'], stored['metadatas'])
+            if chunk_key.startswith(prefix)
+        }
+        
+        changed = [key for key, (_, metadata) in wanted.items() if current.get(key) != metadata['content_hash']]
+        removed = [key for key in current if key not in wanted]
+        
+        for start in range(0, len(removed), CHROMA_BATCH_SIZE):
+            self.vectorstore.delete(ids=removed[start:start + CHROMA_BATCH_SIZE])
+        for start in range(0, len(changed), CHROMA_BATCH_SIZE):
+            keys = changed[start:start + CHROMA_BATCH_SIZE]
+            self.vectorstore.add_texts(
+                texts=[wanted[key][0] for key in keys],
+                metadatas=[wanted[key][1] for key in keys],
+                ids=keys
+            )
+        if changed or removed:
+            self.vectorstore.persist()
+        
+        result = {'unchanged': len(wanted) - len(changed), 'upserted': len(changed), 'deleted': len(removed)}
+        logger.info(f"Chroma knowledge base synced: {result}")
+        return result
@@ -0,0 +1,123 @@
+"""Recall@k / latency benchmark for KB retrieval (BM25 vs dense vs hybrid).
+
+    python -m utils.retrieval_eval [--k 3] [--runs 5]
+
+Indexes a fixed HR corpus in memory (the database is not touched) and runs a
+fixed question set whose answers use both exact terms and paraphrases.
+"""
+from models import KnowledgeBase
+from utils.kb_index import KBIndex
+from utils.vector_index import DenseKBIndex
+from utils.hybrid_search import HybridRetriever
+from utils.advanced_rag import advanced_rag
+from datetime import datetime
+import argparse
+import logging
+import statistics
+import time
+
+CORPUS = [
+    ('Payroll', 'Jadwal Pembayaran Gaji', 'Gaji karyawan ditransfer ke rekening setiap tanggal 25. Jika jatuh pada hari libur, pembayaran dimajukan ke hari kerja sebelumnya.', 'gaji,payroll,transfer'),
+    ('Payroll', 'Tunjangan Hari Raya (THR)', 'THR sebesar satu kali gaji dibayarkan paling lambat 7 hari sebelum Idul Fitri kepada karyawan dengan masa kerja minimal 1 bulan.', 'thr,lebaran,tunjangan'),
+    ('Payroll', 'Potongan BPJS', 'Setiap bulan gaji dipotong iuran BPJS Kesehatan 1% dan BPJS Ketenagakerjaan 2% dari gaji pokok.', 'bpjs,potongan,asuransi'),
+    ('Cuti', 'Hak Cuti Tahunan', 'Karyawan berhak atas 12 hari cuti tahunan. Sisa cuti dapat dibawa ke tahun berikutnya maksimal 6 hari.', 'cuti,tahunan,sisa'),
+    ('Cuti', 'Cara Mengajukan Cuti', 'Pengajuan cuti dilakukan melalui bot menu Cuti paling lambat 3 hari sebelumnya dan disetujui atasan langsung.', 'cuti,pengajuan,approval'),
+    ('Cuti', 'Cuti Sakit', 'Karyawan yang sakit lebih dari 2 hari wajib melampirkan surat keterangan dokter.', 'sakit,dokter,izin'),
+    ('Absensi', 'Jam Kerja dan Keterlambatan', 'Jam kerja 08.00 sampai 17.00. Clock in setelah 08.15 dicatat terlambat.', 'absensi,jam kerja,terlambat'),
+    ('Absensi', 'Kerja Lembur', 'Lembur harus disetujui atasan. Upah lembur dihitung 1,5 kali upah per jam untuk jam pertama dan 2 kali untuk jam berikutnya, termasuk hari libur.', 'lembur,overtime'),
+    ('Absensi', 'Work From Home', 'Karyawan dapat bekerja dari rumah maksimal 2 hari per minggu dengan persetujuan atasan.', 'wfh,remote'),
+    ('Umum', 'Perjalanan Dinas', 'Uang harian perjalanan dinas luar kota Rp 500.000 per hari, tiket dan hotel ditanggung kantor.', 'dinas,travel,uang harian'),
+    ('Umum', 'Reimbursement Kesehatan', 'Biaya berobat rawat jalan dapat diklaim dengan kuitansi asli maksimal 30 hari setelah tanggal berobat.', 'klaim,reimbursement,kesehatan'),
+    ('Umum', 'Kebijakan Gratifikasi', 'Karyawan dilarang menerima hadiah atau pemberian dari vendor dan mitra. Pemberian wajib dilaporkan ke unit kepatuhan.', 'gratifikasi,hadiah,etika'),
+]
+
+# question -> judul of the entry that answers it
+QUESTIONS = [
+    ('kapan gajian bulan ini?', 'Jadwal Pembayaran Gaji'),
+    ('tanggal berapa gaji ditransfer', 'Jadwal Pembayaran Gaji'),
+    ('THR cair kapan', 'Tunjangan Hari Raya (THR)'),
+    ('bonus lebaran dibayar kapan', 'Tunjangan Hari Raya (THR)'),
+    ('potongan bpjs berapa persen', 'Potongan BPJS'),
+    ('iuran asuransi kesehatan dipotong dari gaji?', 'Potongan BPJS'),
+    ('sisa cuti tahunan saya berapa hari', 'Hak Cuti Tahunan'),
+    ('jatah libur setahun berapa', 'Hak Cuti Tahunan'),
+    ('bagaimana cara ajukan cuti', 'Cara Mengajukan Cuti'),
+    ('saya sakit, perlu surat dokter?', 'Cuti Sakit'),
+    ('jam masuk kantor jam berapa', 'Jam Kerja dan Keterlambatan'),
+    ('datang jam 08.20 dihitung telat?', 'Jam Kerja dan Keterlambatan'),
+    ('hitungan upah lembur', 'Kerja Lembur'),
+    ('kerja di hari minggu dibayar berapa', 'Kerja Lembur'),
+    ('boleh kerja dari rumah?', 'Work From Home'),
+    ('uang harian dinas luar kota', 'Perjalanan Dinas'),
+    ('klaim biaya berobat', 'Reimbursement Kesehatan'),
+    ('boleh terima hadiah dari vendor?', 'Kebijakan Gratifikasi'),
+]
+
+
+def build_corpus() -> list:
+    now = datetime.now()
+    return [
+        KnowledgeBase(id=i, kategori=kategori, judul=judul, konten=konten, tags=tags, updated_at=now)
+        for i, (kategori, judul, konten, tags) in enumerate(CORPUS, 1)
+    ]
+
+
+def evaluate(name: str, search, k: int, runs: int) -> dict:
+    """search(question, top_k) -> [entry, ...]"""
+    hits, reciprocal_ranks, latencies = 0, [], []
+    for question, expected in QUESTIONS:
+        for _ in range(runs):
+            start = time.perf_counter()
+            results = search(question, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        titles = [entry.judul for entry in results]
+        if expected in titles:
+            hits += 1
+            reciprocal_ranks.append(1 / (titles.index(expected) + 1))
+        else:
+            reciprocal_ranks.append(0.0)
+
+    latencies.sort()
+    return {
+        'name': name,
+        'recall': hits / len(QUESTIONS),
+        'mrr': statistics.mean(reciprocal_ranks),
+        'p50_ms': latencies[len(latencies) // 2],
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--runs', type=int, default=5, help='repetitions per question for latency')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    corpus = build_corpus()
+    lexical = KBIndex()
+    lexical.load_entries(corpus)
+    dense = DenseKBIndex()
+    dense.load_entries(corpus)
+    hybrid = HybridRetriever(lexical=lexical, dense=dense)
+
+    methods = [
+        ('bm25', lambda q, k: [e for e, s in lexical.search(advanced_rag.query_terms(q), top_k=k)]),
+        ('hybrid', lambda q, k: [e for e, s in hybrid.search(q, advanced_rag.query_terms(q), top_k=k)]),
+    ]
+    if dense.available:
+        methods.insert(1, ('dense', lambda q, k: [e for e, s in dense.search(q, top_k=k)]))
+    else:
+        print("sentence-transformers unavailable: dense skipped, hybrid == bm25")
+
+    print(f"{len(CORPUS)} entries, {len(QUESTIONS)} questions, k={args.k}")
+    print(f"{'method':<8} {'recall@k':>9} {'mrr':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, search in methods:
+        result = evaluate(name, search, args.k, args.runs)
+        print(f"{result['name']:<8} {result['recall']:>9.2f} {result['mrr']:>6.2f} "
+              f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Cold-start profile of the bot.
+
+    python bot.py --profile-startup [--budget 5] [--top 15] [--network]
+    python -m utils.startup_profile ...
+
+Starts a fresh interpreter with `-X importtime`, imports `bot`, runs
+init_db, builds the Application (the point where polling would begin) and
+then the background AI initialisation (Groq clients, KB indexes, embedding
+model). With --network it also times the first getUpdates round trip.
+Exits 1 when cold start (import + init_db + build) exceeds the budget.
+"""
+from config.settings import STARTUP_BUDGET_SECONDS
+from pathlib import Path
+import argparse
+import json
+import subprocess
+import sys
+
+MARKER = 'STARTUP_PROFILE '
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = '''
+import asyncio, json, sys, time
+timings = {}
+start = time.perf_counter()
+import bot
+timings['import_bot'] = time.perf_counter() - start
+
+mark = time.perf_counter()
+bot.init_db()
+timings['init_db'] = time.perf_counter() - mark
+
+mark = time.perf_counter()
+app = bot.build_application()
+timings['build_application'] = time.perf_counter() - mark
+timings['cold_start'] = time.perf_counter() - start
+
+mark = time.perf_counter()
+bot.advanced_rag.initialize()
+timings['ai_init'] = time.perf_counter() - mark
+
+if NETWORK:
+    async def first_update():
+        await app.initialize()
+        try:
+            await app.bot.get_updates(timeout=0, limit=1)
+        finally:
+            await app.shutdown()
+    mark = time.perf_counter()
+    try:
+        asyncio.run(first_update())
+        timings['first_get_updates'] = time.perf_counter() - mark
+    except Exception as e:
+        timings['first_get_updates_error'] = repr(e)
+
+print(MARKER + json.dumps(timings))
+'''
+
+
+def parse_importtime(stderr: str) -> list:
+    """[(cumulative_us, self_us, module, depth), ...] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        module = name.rstrip()
+        depth = (len(module) - len(module.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), module.strip(), depth))
+    return rows
+
+
+def profile(network: bool = False) -> tuple:
+    """(timings, import rows) measured in a fresh interpreter."""
+    code = CHILD.replace('NETWORK', repr(network)).replace('MARKER', repr(MARKER))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith(MARKER)]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"startup profile failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+    return json.loads(lines[-1][len(MARKER):]), parse_importtime(proc.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS, help='cold start budget in seconds')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--network', action='store_true', help='also time the first getUpdates call')
+    args = parser.parse_args(argv)
+
+    timings, imports = profile(args.network)
+
+    print("Startup profile (fresh interpreter)")
+    for name, label in [
+        ('import_bot', 'import bot'),
+        ('init_db', 'init_db'),
+        ('build_application', 'build application'),
+    ]:
+        print(f"  {label:<24} {timings[name]:>7.3f} s")
+    ok = timings['cold_start'] <= args.budget
+    print(f"  {'cold start':<24} {timings['cold_start']:>7.3f} s   budget {args.budget:.1f} s  [{'OK' if ok else 'OVER BUDGET'}]")
+    print(f"  {'AI init (background)':<24} {timings['ai_init']:>7.3f} s")
+    if 'first_get_updates' in timings:
+        print(f"  {'first getUpdates':<24} {timings['first_get_updates']:>7.3f} s")
+    elif 'first_get_updates_error' in timings:
+        print(f"  {'first getUpdates':<24} failed: {timings['first_get_updates_error']}")
+
+    print(f"\nSlowest imports (cumulative, {len(imports)} modules):")
+    for cumulative_us, self_us, module, depth in sorted(imports, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1e6:>7.3f} s  (self {self_us / 1e6:.3f})  {'  ' * depth}{module}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
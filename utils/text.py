@@ -0,0 +1,20 @@
+"""Text helpers shared by the KB indexes, chunking and prompt assembly."""
+import math
+import re
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Llama-3 averages ~3.5 characters per token on Indonesian text; no tokenizer is shipped for Groq models.
+CHARS_PER_TOKEN = 3.5
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word tokens."""
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate LLM token count."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
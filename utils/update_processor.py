@@ -0,0 +1,160 @@
+"""Concurrent update processing that keeps each chat's updates in order.
+
+`PerChatUpdateProcessor` lets updates from different chats run at the same
+time on up to `workers` slots, while updates from one chat (or user, for
+updates without a chat) run strictly one after another in arrival order, so
+a double-tapped "Clock In" is handled twice in sequence instead of racing.
+Updates waiting behind their own chat do not hold a worker slot.
+
+The guarantee covers the handler call itself: a handler registered with
+block=False (bot.py's AI message handler) returns at once and finishes as a
+separate task, outside both the ordering and the worker limit.
+
+    python -m utils.update_processor [--updates 600] [--users 60] [--workers 1 2 4 8 16]
+
+replays synthetic updates through the processor and reports throughput per
+worker count.
+"""
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config.settings import CONCURRENT_UPDATES
+from utils.query_metrics import track, handler_label
+import argparse
+import asyncio
+import random
+import time
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Bounded worker pool with strict per-chat ordering.
+
+    PTB's own semaphore (`max_pending`) only bounds how many updates are in
+    flight; `workers` bounds how many handlers actually run.
+    """
+
+    def __init__(self, workers: int = CONCURRENT_UPDATES, max_pending: int = None):
+        super().__init__(max_pending or max(workers * 4, 2))
+        self.workers = workers
+        self._slots = asyncio.BoundedSemaphore(workers)
+        self._chains = {}
+        self.processed = 0
+        self.serialized = 0
+        self.max_running = 0
+        self._running = 0
+
+    @staticmethod
+    def ordering_key(update: object):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return ('chat', update.effective_chat.id)
+        if update.effective_user:
+            return ('user', update.effective_user.id)
+        return None
+
+    async def _run(self, update: object, coroutine):
+        async with self._slots:
+            self._running += 1
+            self.max_running = max(self.max_running, self._running)
+            try:
+                with track(handler_label(update)):
+                    await coroutine
+            finally:
+                self._running -= 1
+                self.processed += 1
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = self.ordering_key(update)
+        if key is None:
+            await self._run(update, coroutine)
+            return
+
+        # [lock, updates holding or waiting for it]; dropped when the chat goes idle
+        chain = self._chains.setdefault(key, [asyncio.Lock(), 0])
+        chain[1] += 1
+        try:
+            if chain[0].locked():
+                self.serialized += 1
+            async with chain[0]:
+                await self._run(update, coroutine)
+        finally:
+            chain[1] -= 1
+            if not chain[1]:
+                del self._chains[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'processed': self.processed,
+            'serialized': self.serialized,
+            'max_running': self.max_running,
+            'active_chats': len(self._chains)
+        }
+
+
+async def benchmark(workers: int, updates: int, users: int, handler_ms: float, seed: int = 42) -> dict:
+    """Feed `updates` synthetic messages from `users` chats through the processor the way
+    Application's update fetcher does; each handler awaits `handler_ms` of I/O."""
+    from utils.webhook import fake_update
+
+    rng = random.Random(seed)
+    processor = PerChatUpdateProcessor(workers)
+    stream = [
+        Update.de_json(fake_update(update_id, 1_000_000 + rng.randrange(users), '/start'), None)
+        for update_id in range(1, updates + 1)
+    ]
+    handled, running = {}, {}
+    violations = 0
+
+    async def handler(update: Update):
+        nonlocal violations
+        chat_id = update.effective_chat.id
+        running[chat_id] = running.get(chat_id, 0) + 1
+        if running[chat_id] > 1:
+            violations += 1
+        await asyncio.sleep(handler_ms / 1000 * rng.uniform(0.5, 1.5))
+        if handled.get(chat_id, 0) > update.update_id:
+            violations += 1
+        handled[chat_id] = update.update_id
+        running[chat_id] -= 1
+
+    start = time.perf_counter()
+    async with processor:
+        await asyncio.gather(*(processor.process_update(update, handler(update)) for update in stream))
+    elapsed = time.perf_counter() - start
+    return {
+        'elapsed': elapsed,
+        'per_second': updates / elapsed,
+        'violations': violations,
+        **processor.stats()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=600)
+    parser.add_argument('--users', type=int, default=60)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--handler-ms', type=float, default=50, help='mean simulated handler I/O time')
+    args = parser.parse_args()
+
+    print(f"{args.updates} updates from {args.users} chats, ~{args.handler_ms:g} ms per handler")
+    baseline = None
+    for workers in args.workers:
+        result = asyncio.run(benchmark(workers, args.updates, args.users, args.handler_ms))
+        baseline = baseline or result['per_second']
+        print(
+            f"  workers {workers:>3}: {result['per_second']:7.1f} updates/s  (x{result['per_second'] / baseline:4.1f})  "
+            f"max running {result['max_running']:>3}  serialized {result['serialized']:>4}  "
+            f"order violations {result['violations']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
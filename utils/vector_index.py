@@ -0,0 +1,214 @@
+"""Dense (embedding) index untuk knowledge base."""
+from models import SessionLocal, KnowledgeBase, KnowledgeChunk
+from utils.chunking import chunk_sync
+from sqlalchemy import event, update, bindparam
+from sqlalchemy.orm import defer
+from config.settings import EMBEDDING_MODEL, KB_INDEX_REFRESH_SECONDS
+import numpy as np
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def entry_text(entry) -> str:
+    return f"{entry.judul}\n{entry.konten}\n{entry.tags or ''}"
+
+
+class DenseKBIndex:
+    """KB chunk embeddings in one contiguous float32 matrix (row i <-> self.ids[i]).
+
+    Vectors are L2-normalised, so a query is a single matrix-vector product
+    followed by argpartition. Only rows whose `updated_at` changed since they
+    were loaded are fetched on refresh, and only those without a stored
+    `KnowledgeChunk.embedding` for this model are encoded (then persisted).
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, refresh_interval: float = KB_INDEX_REFRESH_SECONDS):
+        self.model_name = model_name
+        self.refresh_interval = refresh_interval
+        self.model = None
+        self.available = True
+        self.matrix = None
+        self.ids = []
+        self.positions = {}
+        self.entries = {}
+        self.versions = {}
+        self._stale = True
+        self._last_check = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def mark_stale(self):
+        self._stale = True
+
+    def load_model(self) -> bool:
+        """Load the sentence-transformer on first use (CPU)."""
+        if self.model is not None or not self.available:
+            return self.available
+        with self._lock:
+            if self.model is not None:
+                return True
+            try:
+                from sentence_transformers import SentenceTransformer
+                self.model = SentenceTransformer(self.model_name, device='cpu')
+                logger.info(f"Embedding model loaded: {self.model_name}")
+            except Exception as e:
+                logger.error(f"Dense retrieval disabled: {e}")
+                self.available = False
+        return self.available
+
+    def embed(self, texts: list) -> np.ndarray:
+        vectors = self.model.encode(
+            texts,
+            batch_size=32,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def load_entries(self, entries: list):
+        """Embed a fixed set of entries instead of the table (evaluation)."""
+        if not self.load_model():
+            return
+        with self._lock:
+            self.matrix = None
+            self.ids, self.positions, self.entries, self.versions = [], {}, {}, {}
+            self._upsert(entries, self.embed([entry_text(entry) for entry in entries]))
+            self._stale = False
+            self.refresh_interval = float('inf')
+
+    def refresh(self, force: bool = False):
+        """Re-embed added/changed KB chunks and drop deleted ones."""
+        now = time.monotonic()
+        if not force and not self._stale and now - self._last_check < self.refresh_interval:
+            return
+        if not self.load_model():
+            return
+
+        chunk_sync.sync(force=force)
+        db = SessionLocal()
+        try:
+            with self._lock:
+                self._last_check = now
+                self._stale = False
+
+                versions = dict(db.query(KnowledgeChunk.id, KnowledgeChunk.updated_at).all())
+                changed_ids = [
+                    entry_id for entry_id, updated_at in versions.items()
+                    if entry_id not in self.versions or self.versions[entry_id] != updated_at
+                ]
+                removed_ids = [entry_id for entry_id in self.ids if entry_id not in versions]
+
+                if removed_ids:
+                    self._remove(removed_ids)
+
+                encoded = []
+                for start in range(0, len(changed_ids), 500):
+                    batch_ids = changed_ids[start:start + 500]
+                    entries = db.query(KnowledgeChunk).options(defer(KnowledgeChunk.embedding)).filter(
+                        KnowledgeChunk.id.in_(batch_ids)
+                    ).all()
+                    stored = {
+                        entry_id: np.frombuffer(blob, dtype=np.float32)
+                        for entry_id, blob in db.query(KnowledgeChunk.id, KnowledgeChunk.embedding).filter(
+                            KnowledgeChunk.id.in_(batch_ids),
+                            KnowledgeChunk.embedding_model == self.model_name,
+                            KnowledgeChunk.embedding.isnot(None)
+                        )
+                    }
+                    self._upsert(entries, self.vectors_for(entries, stored, encoded))
+
+                if encoded:
+                    self.persist(db, encoded)
+
+                if changed_ids or removed_ids:
+                    logger.info(
+                        f"Dense index refreshed: {len(changed_ids)} loaded ({len(encoded)} embedded), "
+                        f"{len(removed_ids)} removed, {len(self.ids)} total"
+                    )
+        finally:
+            db.close()
+
+    def vectors_for(self, entries: list, stored: dict, encoded: list) -> np.ndarray:
+        """Stored vectors where available, the rest encoded in one batch (appended to `encoded`)."""
+        missing = [entry for entry in entries if entry.id not in stored]
+        vectors = dict(stored)
+        if missing:
+            for entry, vector in zip(missing, self.embed([entry_text(entry) for entry in missing])):
+                vectors[entry.id] = vector
+                encoded.append((entry.id, vector))
+        return np.stack([vectors[entry.id] for entry in entries])
+
+    def persist(self, db, encoded: list):
+        """Store freshly encoded vectors so restarts and other workers reuse them."""
+        table = KnowledgeChunk.__table__
+        db.expunge_all()
+        db.execute(
+            update(table).where(table.c.id == bindparam('chunk_id')).values(
+                embedding=bindparam('embedding'), embedding_model=bindparam('embedding_model')
+            ),
+            [
+                {'chunk_id': entry_id, 'embedding': vector.astype(np.float32).tobytes(), 'embedding_model': self.model_name}
+                for entry_id, vector in encoded
+            ]
+        )
+        db.commit()
+
+    def _remove(self, entry_ids: list):
+        drop = set(entry_ids)
+        keep = [row for row, entry_id in enumerate(self.ids) if entry_id not in drop]
+        self.matrix = np.ascontiguousarray(self.matrix[keep])
+        self.ids = [self.ids[row] for row in keep]
+        self.positions = {entry_id: row for row, entry_id in enumerate(self.ids)}
+        for entry_id in drop:
+            self.entries.pop(entry_id, None)
+            self.versions.pop(entry_id, None)
+
+    def _upsert(self, entries: list, vectors: np.ndarray):
+        new_rows = []
+        for entry, vector in zip(entries, vectors):
+            row = self.positions.get(entry.id)
+            if row is None:
+                new_rows.append((entry.id, vector))
+            else:
+                self.matrix[row] = vector
+            self.entries[entry.id] = entry
+            self.versions[entry.id] = entry.updated_at
+
+        if new_rows:
+            added = np.stack([vector for _, vector in new_rows])
+            self.matrix = added if self.matrix is None else np.concatenate([self.matrix, added])
+            for entry_id, _ in new_rows:
+                self.positions[entry_id] = len(self.ids)
+                self.ids.append(entry_id)
+
+    def search(self, query: str, top_k: int = 3) -> list:
+        """Cosine top-k. Returns [(entry, score), ...]."""
+        self.refresh()
+        if not self.available or not self.ids:
+            return []
+
+        query_vector = self.embed([query])[0]
+        with self._lock:
+            scores = self.matrix @ query_vector
+            if len(scores) > top_k:
+                top = np.argpartition(-scores, top_k)[:top_k]
+            else:
+                top = np.arange(len(scores))
+            top = top[np.argsort(-scores[top])]
+            return [(self.entries[self.ids[row]], float(scores[row])) for row in top]
+
+
+dense_index = DenseKBIndex()
+
+
+@event.listens_for(KnowledgeBase, 'after_insert')
+@event.listens_for(KnowledgeBase, 'after_update')
+@event.listens_for(KnowledgeBase, 'after_delete')
+def _mark_dense_index_stale(mapper, connection, target):
+    dense_index.mark_stale()
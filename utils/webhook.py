@@ -0,0 +1,249 @@
+"""Webhook deployment: a small ASGI app that feeds Telegram updates to the bot.
+
+Telegram POSTs each update to WEBHOOK_URL; the app checks the secret token
+header (WEBHOOK_SECRET is required, anyone who finds the URL could forge
+updates otherwise), queues the update on the Application and answers 200 at once, so
+handlers run concurrently (CONCURRENT_UPDATES) while Telegram is not kept
+waiting. Every replica serves the same path, so several can run behind a
+load balancer; keep per-user state in shared stores (HISTORY_BACKEND=redis).
+
+GET /metrics (Prometheus, see utils.query_metrics) and the counters in GET
+/healthz are only answered to local clients: a loopback peer with no proxy
+forwarding headers. A reverse proxy on the same host must send
+X-Forwarded-For (or Forwarded) so its requests are not taken for local ones.
+
+    WEBHOOK_URL=https://hr.example.com/telegram WEBHOOK_SECRET=... python bot.py   # serve with uvicorn
+    python -m utils.webhook --fake-updates 200                  # post fake updates to it
+"""
+from config.settings import WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT
+from telegram import Update
+from utils.query_metrics import query_metrics
+from urllib.parse import urlparse
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1 << 20
+SECRET_HEADER = b'x-telegram-bot-api-secret-token'
+# Telegram's rules for setWebhook's secret_token
+SECRET_RE = re.compile(r'[A-Za-z0-9_-]{1,256}')
+LOOPBACK = ('127.0.0.1', '::1')
+FORWARDED_HEADERS = (b'forwarded', b'x-forwarded-for', b'x-real-ip')
+
+
+class TelegramWebhookApp:
+    """ASGI app: POST <path> -> Application.update_queue, GET /healthz -> status, GET /metrics (local only)."""
+
+    def __init__(self, application, url: str = WEBHOOK_URL, secret_token: str = WEBHOOK_SECRET,
+                 set_webhook: bool = True):
+        if not SECRET_RE.fullmatch(secret_token or ''):
+            raise ValueError("WEBHOOK_SECRET must be 1-256 characters of A-Z, a-z, 0-9, _ and -")
+        self.application = application
+        self.url = url
+        self.path = urlparse(url).path or '/'
+        self.secret_token = secret_token
+        self.set_webhook = set_webhook
+        self.received = 0
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle(scope, receive, send)
+
+    async def startup(self):
+        app = self.application
+        await app.initialize()
+        if app.post_init:
+            await app.post_init(app)
+        if self.set_webhook:
+            await app.bot.set_webhook(
+                self.url, secret_token=self.secret_token, allowed_updates=Update.ALL_TYPES
+            )
+        await app.start()
+        logger.info(f"Webhook serving {self.path} ({getattr(app.update_processor, 'workers', app.concurrent_updates)} workers)")
+
+    async def shutdown(self):
+        # The webhook stays registered: other replicas keep serving it
+        app = self.application
+        if app.running:
+            await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.error(f"Webhook startup failed: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def respond(self, send, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def is_local(scope) -> bool:
+        client = scope.get('client')
+        if not client or client[0] not in LOOPBACK:
+            return False
+        return not any(name in FORWARDED_HEADERS for name, _ in scope['headers'])
+
+    async def handle(self, scope, receive, send):
+        method, path = scope['method'], scope['path']
+        if path == '/healthz' and method == 'GET':
+            status = {'ok': self.application.running}
+            if self.is_local(scope):
+                status.update(
+                    queued=self.application.update_queue.qsize(), received=self.received, rejected=self.rejected
+                )
+            return await self.respond(send, 200, status)
+        if path == '/metrics' and method == 'GET':
+            if not self.is_local(scope):
+                return await self.respond(send, 404, {'ok': False})
+            body = query_metrics.render().encode()
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'text/plain; version=0.0.4'), (b'content-length', str(len(body)).encode())],
+            })
+            return await send({'type': 'http.response.body', 'body': body})
+        if path != self.path:
+            return await self.respond(send, 404, {'ok': False})
+        if method != 'POST':
+            return await self.respond(send, 405, {'ok': False})
+
+        headers = dict(scope['headers'])
+        if not hmac.compare_digest(
+            headers.get(SECRET_HEADER, b''), self.secret_token.encode()
+        ):
+            self.rejected += 1
+            return await self.respond(send, 403, {'ok': False})
+
+        body, more = b'', True
+        while more:
+            message = await receive()
+            body += message.get('body', b'')
+            more = message.get('more_body', False)
+            if len(body) > MAX_BODY_BYTES:
+                self.rejected += 1
+                return await self.respond(send, 413, {'ok': False})
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            self.rejected += 1
+            logger.warning(f"Invalid webhook payload: {e}")
+            return await self.respond(send, 400, {'ok': False})
+
+        self.received += 1
+        await self.application.update_queue.put(update)
+        await self.respond(send, 200, {'ok': True})
+
+
+def run_webhook(application, host: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT):
+    """Serve the bot through uvicorn until interrupted."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL is not set")
+    if not WEBHOOK_SECRET:
+        # Shared by every replica, so it cannot be generated per process
+        raise RuntimeError("WEBHOOK_SECRET is not set; generate one with `python -c \"import secrets; print(secrets.token_urlsafe(32))\"`")
+    import uvicorn
+    uvicorn.run(TelegramWebhookApp(application), host=host, port=port, log_level='warning')
+
+
+def fake_update(update_id: int, user_id: int, text: str) -> dict:
+    now = int(time.time())
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"User {user_id}"}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': now,
+            'chat': {'id': user_id, 'type': 'private', 'first_name': user['first_name']},
+            'from': user,
+            'text': text,
+            **({'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]}
+               if text.startswith('/') else {}),
+        },
+    }
+
+
+async def post_fake_updates(url: str, count: int, users: int, text: str, concurrency: int,
+                            secret_token: str = WEBHOOK_SECRET) -> dict:
+    """POST `count` fake message updates to `url` like Telegram would; returns status counts and latency."""
+    import httpx
+
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret_token} if secret_token else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses, latencies = {}, []
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        async def post(update_id: int):
+            async with semaphore:
+                began = time.perf_counter()
+                try:
+                    response = await client.post(
+                        url, json=fake_update(update_id, 1_000_000 + update_id % users, text), headers=headers
+                    )
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - began)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(i) for i in range(1, count + 1)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'statuses': statuses,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+        'per_second': count / elapsed if elapsed else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fake-updates', type=int, default=100, help='number of updates to post')
+    parser.add_argument('--url', default=f"http://127.0.0.1:{WEBHOOK_PORT}{urlparse(WEBHOOK_URL).path or '/'}")
+    parser.add_argument('--users', type=int, default=50, help='distinct fake user ids')
+    parser.add_argument('--text', default='/start')
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+
+    result = asyncio.run(post_fake_updates(args.url, args.fake_updates, args.users, args.text, args.concurrency))
+    print(
+        f"OK {args.fake_updates} updates to {args.url}: {result['statuses']}, "
+        f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, {result['per_second']:.0f}/s"
+    )
+
+
+if __name__ == '__main__':
+    main()